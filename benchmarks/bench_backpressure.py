@@ -0,0 +1,77 @@
+"""
+Message latency benchmark
+Compares the old fixed 200 ms sleep in on_message with RestBackpressure.admit()
+under normal and heavy outbound REST load
+
+Usage: python benchmarks/bench_backpressure.py [messages] [messages_per_second]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ratelimit import RestBackpressure
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(gate, messages, per_second, rest_load=None):
+    """Feed messages through gate at a steady rate; returns handled latencies in ms"""
+    latencies = []
+    shed = 0
+
+    async def handle(arrived):
+        nonlocal shed
+        if not await gate():
+            shed += 1
+            return
+        latencies.append((time.perf_counter() - arrived) * 1000)
+
+    tasks = []
+    for i in range(messages):
+        if rest_load:
+            rest_load(i)
+        tasks.append(asyncio.create_task(handle(time.perf_counter())))
+        await asyncio.sleep(1 / per_second)
+    await asyncio.gather(*tasks)
+    return latencies, shed
+
+
+def report(name, latencies, shed):
+    if latencies:
+        print(f"  {name:<28} p50 {percentile(latencies, 50):7.2f} ms   p99 {percentile(latencies, 99):7.2f} ms   shed {shed}")
+    else:
+        print(f"  {name:<28} all {shed} messages shed")
+
+
+async def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 1500
+    per_second = float(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    async def fixed_sleep():
+        await asyncio.sleep(0.2)
+        return True
+
+    print(f"📨 {messages} messages at {per_second:.0f}/s")
+    report("fixed 200 ms sleep", *await run(fixed_sleep, messages, per_second))
+
+    idle = RestBackpressure()
+    report("backpressure, idle REST", *await run(idle.admit, messages, per_second))
+
+    # One outbound request per 5 messages: 40 req/s at 200 msg/s, between the soft and hard limits
+    busy = RestBackpressure()
+    report("backpressure, busy REST", *await run(busy.admit, messages, per_second, lambda i: i % 5 or busy.record()))
+
+    # One request per 2 messages: 100 req/s is past the hard limit, so work is shed
+    saturated = RestBackpressure()
+    report("backpressure, saturated REST", *await run(saturated.admit, messages, per_second, lambda i: i % 2 or saturated.record()))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""
+Codec benchmark for bot data
+Generates a synthetic data.json with many guilds and times decode/encode for every available codec
+
+Usage: python benchmarks/bench_codecs.py [guilds] [rounds]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils
+
+
+def synthetic_data(guilds=10000, seed=1):
+    """Build a bot.data dict shaped like a busy production file"""
+    rng = random.Random(seed)
+    data = {key: {} for key in ('custom_commands', 'guild_prefixes', 'stolen_emojis', 'stolen_stickers',
+                                'embeds', 'welcome', 'autoroles', 'autoroles_bot', 'aliases', 'gpd_enabled')}
+    data['no_prefix_users'] = [rng.getrandbits(60) for _ in range(50)]
+
+    for _ in range(guilds):
+        guild_id = str(rng.getrandbits(60))
+        if rng.random() < 0.3:
+            data['guild_prefixes'][guild_id] = rng.choice(['!', '?', '$', 'k!'])
+        commands = {}
+        for i in range(rng.randint(0, 8)):
+            commands[f'cmd{i}'] = {
+                'role_id': rng.getrandbits(60),
+                'role_name': f'Role {i} ✨',
+                'description': 'Custom role command',
+                'created_by': rng.getrandbits(60),
+            }
+        if commands:
+            data['custom_commands'][guild_id] = commands
+            data['aliases'][guild_id] = {f'a{name}': name for name in list(commands)[:2]}
+        if rng.random() < 0.2:
+            data['embeds'][guild_id] = {'welcome': {
+                'title': 'Welcome {user}!', 'description': 'Enjoy your stay in {server}',
+                'color': '#ff66cc', 'thumbnail': None, 'image': None, 'footer': 'Member #{member_count}',
+                'author': {'name': None, 'icon_url': None}, 'timestamp': True,
+            }}
+            data['welcome'][guild_id] = {'embed_name': 'welcome', 'channel_id': rng.getrandbits(60), 'enabled': True}
+        if rng.random() < 0.4:
+            data['autoroles'][guild_id] = [str(rng.getrandbits(60)) for _ in range(rng.randint(1, 3))]
+    return data
+
+
+def timed(func, rounds):
+    """Best-of-rounds wall time in milliseconds"""
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    guilds = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    data = synthetic_data(guilds)
+    codecs = ['stdlib'] + [name for name, module in (('orjson', utils.orjson), ('msgspec', utils.msgspec)) if module]
+
+    utils.JSON_CODEC = 'stdlib'
+    raw = utils.json_dumps(data)
+    print(f"📦 Synthetic data: {guilds} guilds, {len(raw) / 1024 / 1024:.1f} MiB")
+
+    for codec in codecs:
+        utils.JSON_CODEC = codec
+        decode_ms = timed(lambda: utils.json_loads(raw), rounds)
+        encode_ms = timed(lambda: utils.json_dumps(data), rounds)
+        print(f"  {codec:<8} decode {decode_ms:8.1f} ms   encode {encode_ms:8.1f} ms")
+
+    if utils.msgspec is not None:
+        # Validation against the schemas only runs with msgspec as the codec
+        utils.JSON_CODEC = 'msgspec'
+        typed_ms = timed(lambda: utils.decode_data(raw), rounds)
+        print(f"  {'typed':<8} decode {typed_ms:8.1f} ms   (msgspec, decoded then validated against BotData)")
+
+
+if __name__ == '__main__':
+    main()
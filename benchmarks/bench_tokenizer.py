@@ -0,0 +1,109 @@
+"""
+Message tokenizer benchmark
+Messages per second through on_message's parsing steps: the old repeated
+strip()/split()/join() plus get_context() re-parse versus parse_message()
+
+Usage: python benchmarks/bench_tokenizer.py [messages]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from discord.ext.commands.view import StringView
+
+from dispatch import parse_message, rewrite_alias
+
+PREFIX = '!'
+BUILTINS = frozenset(['ban', 'kick', 'mute', 'ping', 'serverinfo', 'userinfo', 'purge', 'help'])
+CUSTOM = {'vip': {'role_id': 1}, 'diva': {'role_id': 2}}
+ALIASES = {'b': 'ban', 'si': 'serverinfo'}
+
+
+def corpus(count, seed=1):
+    rng = random.Random(seed)
+    chatter = "hey did anyone see the match last night it was honestly unreal".split()
+    samples = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.6:
+            samples.append(' '.join(rng.choices(chatter, k=rng.randint(3, 15))))
+        elif roll < 0.8:
+            samples.append(f"{PREFIX}{rng.choice(sorted(BUILTINS))} <@123456789012345678> {' '.join(rng.choices(chatter, k=4))}")
+        elif roll < 0.9:
+            samples.append(f"{PREFIX}{rng.choice(sorted(ALIASES))} <@123456789012345678> spam")
+        else:
+            samples.append(f"{rng.choice(sorted(CUSTOM))} <@123456789012345678>")
+    return samples
+
+
+def old_path(content, no_prefix):
+    """The steps on_message used to take, ending in get_context's own parse"""
+    stripped = content.strip()
+    parts = stripped.split()
+    if parts:
+        cmd_name = parts[0].lower()
+        if stripped.startswith(PREFIX):
+            real_cmd = ALIASES.get(cmd_name)
+            if real_cmd:
+                content = f"{PREFIX}{real_cmd} {' '.join(parts[1:])}".strip()
+        elif no_prefix:
+            real_cmd = ALIASES.get(cmd_name)
+            if real_cmd:
+                content = f"{real_cmd} {' '.join(parts[1:])}".strip()
+
+    cmd_name = content[len(PREFIX):].split()[0].lower() if content.startswith(PREFIX) else ""
+    if cmd_name in CUSTOM:
+        return 'custom'
+    if no_prefix:
+        all_commands = list(BUILTINS)
+        first_word = content.split()[0].lower() if content.split() else ""
+        if first_word in CUSTOM:
+            return 'custom'
+        if first_word in all_commands:
+            content = f"{PREFIX}{content}"
+    view = StringView(content)
+    if view.skip_string(PREFIX):
+        return view.get_word().lower() in BUILTINS and 'builtin'
+    return None
+
+
+def new_path(content, no_prefix):
+    parsed = parse_message(content, PREFIX)
+    if not parsed.word or not (parsed.prefixed or no_prefix):
+        return None
+    real_cmd = ALIASES.get(parsed.word)
+    if real_cmd:
+        parsed = rewrite_alias(parsed, PREFIX, real_cmd)
+    if parsed.word in CUSTOM:
+        return 'custom'
+    if parsed.prefixed or parsed.word in BUILTINS:
+        view = StringView(parsed.content)
+        view.index = view.previous = parsed.args_start
+        return parsed.word in BUILTINS and 'builtin'
+    return None
+
+
+def throughput(func, messages, no_prefix):
+    started = time.perf_counter()
+    for content in messages:
+        func(content, no_prefix)
+    return len(messages) / (time.perf_counter() - started)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    messages = corpus(count)
+    print(f"📨 {count} messages (60% chatter, 40% commands)")
+    for no_prefix in (False, True):
+        label = 'no-prefix user' if no_prefix else 'regular user'
+        old = throughput(old_path, messages, no_prefix)
+        new = throughput(new_path, messages, no_prefix)
+        print(f"  {label:<15} before {old:>11,.0f} msg/s   after {new:>11,.0f} msg/s   ({new / old:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
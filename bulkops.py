@@ -0,0 +1,481 @@
+"""
+Bulk operations for Discord Bot
+Batched, paced and cancellable message deletion and mass bans, with progress reported on a single edited status message
+"""
+
+import asyncio
+import os
+import re
+import time
+
+import discord
+from discord.utils import utcnow
+
+from utils import create_embed, json_dumps
+
+# Discord's bulk delete takes at most 100 messages, none older than 14 days
+BULK_DELETE_LIMIT = 100
+BULK_DELETE_MAX_AGE = 14 * 24 * 3600 - 60  # A minute of margin for clock skew
+
+# Pause between single deletes of messages too old to bulk delete
+OLD_DELETE_DELAY = float(os.getenv('BULK_OLD_DELETE_DELAY', '1.0'))
+
+# Minimum seconds between status message edits
+PROGRESS_INTERVAL = float(os.getenv('BULK_PROGRESS_INTERVAL', '2.0'))
+
+# Minimum seconds between bulk requests from one operation, and the longest backoff under load
+BULK_REQUEST_INTERVAL = float(os.getenv('BULK_REQUEST_INTERVAL', '1.0'))
+BULK_MAX_BACKOFF = 8.0
+
+
+def bulk_deletable(message, now=None):
+    """True if a message is young enough for bulk delete"""
+    now = now or utcnow()
+    return (now - message.created_at).total_seconds() < BULK_DELETE_MAX_AGE
+
+
+def message_filter(user=None, bots=False, contains=None, attachments=False):
+    """Combine purge filters into one check; with no filters every message matches"""
+    checks = []
+    if user is not None:
+        checks.append(lambda message: message.author.id == user.id)
+    if bots:
+        checks.append(lambda message: message.author.bot)
+    if contains:
+        needle = contains.lower()
+        checks.append(lambda message: needle in message.content.lower())
+    if attachments:
+        checks.append(lambda message: bool(message.attachments))
+    return lambda message: all(check(message) for check in checks)
+
+
+class BulkPacer:
+    """Spaces one bulk operation's requests and backs off while the bot's REST load is high
+
+    Bulk work never gets shed like message handling does. While the shared
+    RestBackpressure load is above its soft limit, or just after a 429, it
+    waits with exponential backoff and then carries on.
+    """
+
+    def __init__(self, backpressure=None, interval=BULK_REQUEST_INTERVAL):
+        self.backpressure = backpressure
+        self.interval = interval
+        self._last = 0.0
+        self.waited = 0.0
+
+    async def wait(self, interval=None):
+        started = time.monotonic()
+        delay = self._last + (self.interval if interval is None else interval) - started
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.backpressure is not None:
+            backoff = 0.5
+            while self.backpressure.load() >= self.backpressure.soft:
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, BULK_MAX_BACKOFF)
+        self._last = time.monotonic()
+        self.waited += self._last - started
+
+
+class CancelView(discord.ui.View):
+    """Cancel button for a running bulk operation; only its invoker can press it
+
+    Pressing it awaits `on_cancel(interaction)` if one is set; when that returns
+    True it has answered the interaction itself. Otherwise the button turns
+    into "Cancelling..." and `cancelled` is set only after that edit, so the
+    operation's final edit always lands last.
+    """
+
+    def __init__(self, author, timeout=None, on_cancel=None, cancelled=None):
+        super().__init__(timeout=timeout)
+        self.author = author
+        self.on_cancel = on_cancel
+        self.cancelled = cancelled or asyncio.Event()
+
+    @discord.ui.button(label="Cancel", style=discord.ButtonStyle.danger)
+    async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if interaction.user.id != self.author.id:
+            await interaction.response.send_message("❌ Only the person who started this can cancel it!", ephemeral=True)
+            return
+        if self.on_cancel is not None and await self.on_cancel(interaction):
+            return
+        button.disabled = True
+        button.label = "Cancelling..."
+        try:
+            await interaction.response.edit_message(view=self)
+        finally:
+            self.cancelled.set()
+
+
+class StatusMessage:
+    """One status embed that is edited in place as a long operation progresses
+
+    Edits are throttled to one per `interval` seconds; finish() always edits.
+    """
+
+    def __init__(self, ctx, title, interval=PROGRESS_INTERVAL, view=None):
+        self.ctx = ctx
+        self.title = title
+        self.interval = interval
+        self.view = view
+        self.message = None
+        self._last_edit = 0.0
+
+    async def start(self, description):
+        if self.view is None:
+            self.message = await self.ctx.send(embed=create_embed(self.title, description))
+        else:
+            self.message = await self.ctx.send(embed=create_embed(self.title, description), view=self.view)
+        self._last_edit = time.monotonic()
+        return self.message
+
+    async def update(self, description):
+        if self.message is None or time.monotonic() - self._last_edit < self.interval:
+            return
+        self._last_edit = time.monotonic()
+        try:
+            await self.message.edit(embed=create_embed(self.title, description))
+        except discord.HTTPException:
+            pass  # Progress is best-effort
+
+    async def finish(self, title, description, delete_after=None):
+        embed = create_embed(title, description)
+        try:
+            if self.message is None:
+                self.message = await self.ctx.send(embed=embed, delete_after=delete_after)
+            else:
+                await self.message.edit(embed=embed, view=None, delete_after=delete_after)
+        except discord.HTTPException:
+            pass
+        if self.view is not None:
+            self.view.stop()
+
+
+class DeleteResult:
+    """Counts from a bulk delete run"""
+    __slots__ = ('scanned', 'bulk', 'single', 'failed', 'cancelled')
+
+    def __init__(self):
+        self.scanned = 0
+        self.bulk = 0
+        self.single = 0
+        self.failed = 0
+        self.cancelled = False
+
+    @property
+    def deleted(self):
+        return self.bulk + self.single
+
+    def summary(self):
+        text = f"Checked **{self.scanned}** messages, deleted **{self.deleted}**"
+        if self.single:
+            text += f" ({self.single} older than 14 days, one at a time)"
+        if self.failed:
+            text += f"\n**{self.failed}** could not be deleted"
+        if self.cancelled:
+            text += "\nStopped early: cancelled"
+        return text
+
+
+async def delete_matching(channel, messages, check, progress=None, reason=None, pacer=None, cancelled=None,
+                          checkpoint=None):
+    """Delete the messages from an async (newest-first) iterator that pass check
+
+    Messages under 14 days old are deleted 100 per request as they stream
+    in. Older ones come after them in history; when the first one arrives
+    the pending batch is flushed, then they are deleted one at a time, at
+    most one per OLD_DELETE_DELAY. Every request waits on the pacer first,
+    and setting the `cancelled` event stops the run between requests.
+
+    After each request `checkpoint(message_id, result)` is called with the
+    last message scanned: everything up to it has been handled, so a rerun
+    can continue before that ID. Returns a DeleteResult.
+    """
+    result = DeleteResult()
+    pacer = pacer or BulkPacer()
+    batch = []
+    now = utcnow()
+
+    def stopped():
+        if cancelled is not None and cancelled.is_set():
+            result.cancelled = True
+        return result.cancelled
+
+    async def flush():
+        await pacer.wait()
+        try:
+            await channel.delete_messages(batch, reason=reason)
+            result.bulk += len(batch)
+        except discord.NotFound:
+            pass  # Already deleted (only raised for a single message)
+        except discord.Forbidden:
+            raise
+        except discord.HTTPException:
+            result.failed += len(batch)
+        batch.clear()
+
+    async def delete_old(message):
+        await pacer.wait(OLD_DELETE_DELAY)
+        try:
+            await message.delete()
+            result.single += 1
+        except discord.NotFound:
+            pass
+        except discord.Forbidden:
+            raise
+        except discord.HTTPException:
+            result.failed += 1
+
+    last = None
+    async for message in messages:
+        if stopped():
+            break
+        result.scanned += 1
+        last = message
+        if not check(message):
+            continue
+        if bulk_deletable(message, now):
+            batch.append(message)
+            if len(batch) < BULK_DELETE_LIMIT:
+                continue
+            await flush()
+        else:
+            if batch:
+                await flush()
+                if stopped():
+                    break
+            await delete_old(message)
+        if checkpoint:
+            checkpoint(message.id, result)
+        if progress:
+            await progress.update(result.summary())
+
+    if batch and not stopped():
+        await flush()
+    if checkpoint and last is not None and not result.cancelled:
+        checkpoint(last.id, result)
+
+    return result
+
+
+# Discord's bulk ban takes at most 200 users per request
+BULK_BAN_LIMIT = 200
+
+# Individual bans in flight at once when bulk ban is unavailable
+BAN_CONCURRENCY = int(os.getenv('BAN_CONCURRENCY', '5'))
+
+_ID_TOKEN = re.compile(r'^<@!?(\d{15,20})>$|^(\d{15,20})$')
+
+
+def parse_user_ids(text):
+    """Split IDs/mentions separated by spaces or commas into (unique IDs in order, invalid tokens)"""
+    ids = {}
+    invalid = []
+    for token in re.split(r'[\s,]+', text.strip()):
+        if not token:
+            continue
+        match = _ID_TOKEN.match(token)
+        if match:
+            ids[int(match.group(1) or match.group(2))] = None
+        else:
+            invalid.append(token)
+    return list(ids), invalid
+
+
+class BanReport:
+    """Per-ID outcome of a mass ban"""
+
+    def __init__(self):
+        self.results = {}  # user_id -> (status, detail)
+        self.bulk_requests = 0
+        self.single_requests = 0
+        self.cancelled = False
+
+    def add(self, user_id, status, detail=None):
+        self.results[user_id] = (status, detail)
+
+    def count(self, status):
+        return sum(1 for result, _ in self.results.values() if result == status)
+
+    def summary(self):
+        text = f"**Banned:** {self.count('banned')}\n**Failed:** {self.count('failed')}"
+        skipped = self.count('skipped')
+        if skipped:
+            text += f"\n**Skipped:** {skipped}"
+        if self.cancelled:
+            text += "\nStopped early: cancelled"
+        return text
+
+    def to_json(self, invalid=()):
+        """Structured report for the moderator: one entry per ID, plus unparseable tokens"""
+        return json_dumps({
+            'results': [
+                {'user_id': str(user_id), 'status': status, 'detail': detail}
+                for user_id, (status, detail) in self.results.items()
+            ],
+            'invalid': list(invalid),
+            'requests': {'bulk': self.bulk_requests, 'single': self.single_requests},
+        })
+
+
+async def mass_ban(guild, user_ids, reason=None, progress=None, pacer=None, concurrency=BAN_CONCURRENCY,
+                   report=None, checkpoint=None, cancelled=None):
+    """Ban user IDs without fetching them first
+
+    IDs go to guild.bulk_ban 200 at a time. If bulk ban is refused (it also
+    needs Manage Server) or errors, the remaining IDs are banned one by one
+    as discord.Object, `concurrency` at a time. checkpoint(handled, report)
+    is called after each bulk request. Setting the `cancelled` event stops
+    the run before the next bulk request or single ban. Returns the BanReport.
+    """
+    report = report or BanReport()
+    pacer = pacer or BulkPacer()
+    pending = list(user_ids)
+
+    def stopped():
+        if cancelled is not None and cancelled.is_set():
+            report.cancelled = True
+        return report.cancelled
+
+    while pending and not stopped():
+        chunk = pending[:BULK_BAN_LIMIT]
+        await pacer.wait()
+        try:
+            result = await guild.bulk_ban([discord.Object(id=user_id) for user_id in chunk], reason=reason)
+        except discord.HTTPException:
+            break  # Fall back to single bans for everything left
+        report.bulk_requests += 1
+        for user in result.banned:
+            report.add(user.id, 'banned')
+        for user in result.failed:
+            report.add(user.id, 'failed', 'already banned or not bannable')
+        del pending[:BULK_BAN_LIMIT]
+        if checkpoint:
+            checkpoint(len(user_ids) - len(pending), report)
+        if progress:
+            await progress.update(f"{report.summary()}\n**Remaining:** {len(pending)}")
+
+    if pending and not stopped():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def ban_one(user_id):
+            async with semaphore:
+                await pacer.wait(0)
+                if stopped():
+                    return
+                report.single_requests += 1
+                try:
+                    await guild.ban(discord.Object(id=user_id), reason=reason)
+                    report.add(user_id, 'banned')
+                except discord.NotFound:
+                    report.add(user_id, 'failed', 'unknown user')
+                except discord.Forbidden:
+                    report.add(user_id, 'failed', 'missing permission or role too low')
+                except discord.HTTPException as e:
+                    report.add(user_id, 'failed', str(e))
+                if progress:
+                    await progress.update(f"{report.summary()}\n**Remaining:** {len(user_ids) - len(report.results)}")
+
+        await asyncio.gather(*(ban_one(user_id) for user_id in pending))
+
+    return report
+
+
+# Role edits in flight at once. Every add/remove in a guild shares one route
+# bucket, and discord.py queues requests past its limit, so a few is enough
+ROLE_CONCURRENCY = int(os.getenv('MASSROLE_CONCURRENCY', '4'))
+
+# Members processed between checkpoint writes
+CHECKPOINT_EVERY = 50
+
+
+def member_query(role, action, user_ids=None, has_role_id=None, joined_after=None, bots=None):
+    """Build the target check for a role operation over the member cache
+
+    Members who already have (add) or lack (remove) the role are never
+    targets, so a resumed or repeated run only touches what is left.
+    """
+    user_ids = set(user_ids) if user_ids is not None else None
+
+    def check(member):
+        if (role in member.roles) == (action == 'add'):
+            return False
+        if user_ids is not None and member.id not in user_ids:
+            return False
+        if has_role_id is not None and member.get_role(has_role_id) is None:
+            return False
+        if joined_after is not None and (member.joined_at is None or member.joined_at.timestamp() <= joined_after):
+            return False
+        if bots is not None and member.bot != bots:
+            return False
+        return True
+
+    return check
+
+
+def select_members(guild, check, after_id=0):
+    """Members matching check with an ID above the cursor, in ID order"""
+    return sorted((member for member in guild.members if member.id > after_id and check(member)), key=lambda member: member.id)
+
+
+class RoleResult:
+    """Counts and cursor of a role operation"""
+    __slots__ = ('done', 'failed', 'cursor', 'cancelled')
+
+    def __init__(self, done=0, failed=0, cursor=0):
+        self.done = done
+        self.failed = failed
+        self.cursor = cursor
+        self.cancelled = False
+
+    def summary(self, remaining=None):
+        text = f"**Updated:** {self.done}\n**Failed:** {self.failed}"
+        if remaining is not None:
+            text += f"\n**Remaining:** {remaining}"
+        if self.cancelled:
+            text += "\nStopped early: cancelled"
+        return text
+
+
+async def apply_role(members, role, action, reason=None, result=None, progress=None, pacer=None,
+                     checkpoint=None, cancelled=None, concurrency=ROLE_CONCURRENCY):
+    """Add or remove a role for members (in ID order), `concurrency` requests at a time
+
+    Members are processed in windows; once a window finishes, result.cursor
+    is its highest ID, so everything at or below the cursor is handled.
+    checkpoint(result) is called every CHECKPOINT_EVERY members and at the end.
+    """
+    result = result or RoleResult()
+    pacer = pacer or BulkPacer()
+    since_checkpoint = 0
+
+    async def update(member):
+        await pacer.wait(0)
+        try:
+            if action == 'add':
+                await member.add_roles(role, reason=reason)
+            else:
+                await member.remove_roles(role, reason=reason)
+            result.done += 1
+        except discord.NotFound:
+            pass  # Left the guild
+        except discord.HTTPException:
+            result.failed += 1
+
+    for start in range(0, len(members), concurrency):
+        if cancelled is not None and cancelled.is_set():
+            result.cancelled = True
+            break
+        window = members[start:start + concurrency]
+        await asyncio.gather(*(update(member) for member in window))
+        result.cursor = window[-1].id
+        since_checkpoint += len(window)
+        if checkpoint and since_checkpoint >= CHECKPOINT_EVERY:
+            checkpoint(result)
+            since_checkpoint = 0
+        if progress:
+            await progress.update(result.summary(len(members) - start - len(window)))
+
+    if checkpoint:
+        checkpoint(result)
+    return result
@@ -0,0 +1,432 @@
+"""
+In-memory caches for Discord Bot
+Bounded structures for runtime state that is not persisted: sniped messages, ban lists, member counts and user profiles
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+
+import discord
+
+from ratelimit import ExpiringStore
+
+# Deleted messages kept per channel, and across all channels
+SNIPE_PER_CHANNEL = int(os.getenv('SNIPE_PER_CHANNEL', '10'))
+SNIPE_MAX_RECORDS = int(os.getenv('SNIPE_MAX_RECORDS', '20000'))
+
+# Longest content stored per deleted message (snipe shows 1000 characters)
+SNIPE_MAX_CONTENT = 1024
+
+
+class DeletedMessage:
+    """Compact record of a deleted message"""
+    __slots__ = ('author', 'author_id', 'content', 'attachment', 'deleted_at')
+
+    def __init__(self, author, author_id, content, attachment, deleted_at):
+        self.author = author
+        self.author_id = author_id
+        self.content = content
+        self.attachment = attachment
+        self.deleted_at = deleted_at
+
+    @classmethod
+    def from_message(cls, message):
+        return cls(
+            str(message.author),
+            message.author.id,
+            message.content[:SNIPE_MAX_CONTENT],
+            message.attachments[0].url if message.attachments else None,
+            datetime.now(timezone.utc),
+        )
+
+
+class SnipeCache:
+    """Per-channel ring buffers of recently deleted messages
+
+    Each channel keeps its last `per_channel` deletions in a fixed-size deque.
+    Channels are kept in LRU order and whole buffers are dropped from the
+    least recently active channel once `max_records` is exceeded.
+    """
+
+    def __init__(self, per_channel=SNIPE_PER_CHANNEL, max_records=SNIPE_MAX_RECORDS):
+        self.per_channel = per_channel
+        self.max_records = max_records
+        self._channels = OrderedDict()  # channel_id -> deque of DeletedMessage
+        self.records = 0
+        self.stored = 0
+        self.uncached = 0
+        self.dropped_channels = 0
+
+    def add(self, channel_id, record):
+        buffer = self._channels.get(channel_id)
+        if buffer is None:
+            buffer = self._channels[channel_id] = deque(maxlen=self.per_channel)
+        else:
+            self._channels.move_to_end(channel_id)
+        if len(buffer) == self.per_channel:
+            self.records -= 1  # The append below pushes out the oldest
+        buffer.append(record)
+        self.records += 1
+        self.stored += 1
+
+        while self.records > self.max_records:
+            _, oldest = self._channels.popitem(last=False)
+            self.records -= len(oldest)
+            self.dropped_channels += 1
+
+    def get(self, channel_id, index=1):
+        """Return the index-th most recent deletion in a channel (1 = latest), or None"""
+        buffer = self._channels.get(channel_id)
+        if not buffer or not 1 <= index <= len(buffer):
+            return None
+        return buffer[-index]
+
+    def stats(self):
+        return {
+            'channels': len(self._channels),
+            'records': self.records,
+            'max_records': self.max_records,
+            'per_channel': self.per_channel,
+            'stored': self.stored,
+            'uncached_deletes': self.uncached,
+            'dropped_channels': self.dropped_channels,
+        }
+
+
+# Guilds whose ban lists are kept, and how often each is re-fetched to correct drift
+BAN_INDEX_MAX_GUILDS = int(os.getenv('BAN_INDEX_MAX_GUILDS', '1000'))
+BAN_RECONCILE_INTERVAL = float(os.getenv('BAN_RECONCILE_INTERVAL', str(6 * 3600)))
+
+
+class BanIndex:
+    """Per-guild sets of banned user IDs, fetched once and kept current from ban events
+
+    A guild's bans are paged in the first time they are needed. Concurrent
+    first requests share one fetch, and ban/unban events that arrive while it
+    runs are applied on top of it. After that, counts are len() of a set.
+    reconcile() re-fetches guilds older than `reconcile_interval` and records
+    how many IDs had drifted. Guilds are evicted LRU-first past `max_guilds`.
+    """
+
+    def __init__(self, max_guilds=BAN_INDEX_MAX_GUILDS, reconcile_interval=BAN_RECONCILE_INTERVAL):
+        self.max_guilds = max_guilds
+        self.reconcile_interval = reconcile_interval
+        self._guilds = OrderedDict()  # guild_id -> set of banned user IDs
+        self._loaded_at = {}
+        self._loading = {}  # guild_id -> Task fetching its bans
+        self._pending = {}  # guild_id -> [(banned, user_id)] seen during a fetch
+        self.metrics = {'loads': 0, 'reconciles': 0, 'drift': 0, 'events': 0}
+
+    async def _fetch(self, guild):
+        self._pending[guild.id] = []
+        try:
+            banned = set()
+            async for entry in guild.bans(limit=None):
+                banned.add(entry.user.id)
+            for is_ban, user_id in self._pending[guild.id]:
+                if is_ban:
+                    banned.add(user_id)
+                else:
+                    banned.discard(user_id)
+        finally:
+            del self._pending[guild.id]
+        return banned
+
+    async def _populate(self, guild):
+        try:
+            banned = await self._fetch(guild)
+        finally:
+            self._loading.pop(guild.id, None)
+        self._store(guild.id, banned)
+        self.metrics['loads'] += 1
+        return banned
+
+    def _store(self, guild_id, banned):
+        self._guilds[guild_id] = banned
+        self._guilds.move_to_end(guild_id)
+        self._loaded_at[guild_id] = time.monotonic()
+        while len(self._guilds) > self.max_guilds:
+            evicted, _ = self._guilds.popitem(last=False)
+            self._loaded_at.pop(evicted, None)
+
+    async def count(self, guild):
+        """Number of bans in a guild; raises discord.Forbidden without Ban Members"""
+        banned = self._guilds.get(guild.id)
+        if banned is not None:
+            self._guilds.move_to_end(guild.id)
+            return len(banned)
+        task = self._loading.get(guild.id)
+        if task is None:
+            task = self._loading[guild.id] = asyncio.create_task(self._populate(guild))
+        return len(await asyncio.shield(task))
+
+    def is_banned(self, guild_id, user_id):
+        """True/False from the index, or None if the guild isn't indexed"""
+        banned = self._guilds.get(guild_id)
+        return None if banned is None else user_id in banned
+
+    def _event(self, guild_id, user_id, is_ban):
+        self.metrics['events'] += 1
+        pending = self._pending.get(guild_id)
+        if pending is not None:
+            pending.append((is_ban, user_id))
+        banned = self._guilds.get(guild_id)
+        if banned is None:
+            return  # Not indexed yet; the first fetch will include it
+        if is_ban:
+            banned.add(user_id)
+        else:
+            banned.discard(user_id)
+
+    def on_ban(self, guild_id, user_id):
+        self._event(guild_id, user_id, True)
+
+    def on_unban(self, guild_id, user_id):
+        self._event(guild_id, user_id, False)
+
+    async def reconcile(self, bot):
+        """Re-fetch stale guilds one at a time and correct any drift"""
+        now = time.monotonic()
+        stale = [guild_id for guild_id in self._guilds if now - self._loaded_at.get(guild_id, 0) > self.reconcile_interval]
+        for guild_id in stale:
+            guild = bot.get_guild(guild_id)
+            if guild is None:
+                self._guilds.pop(guild_id, None)
+                self._loaded_at.pop(guild_id, None)
+                continue
+            if guild_id in self._loading:
+                continue
+            try:
+                banned = await self._fetch(guild)
+            except Exception as e:
+                print(f"❌ Ban index reconcile failed for {guild_id}: {e}")
+                continue
+            current = self._guilds.get(guild_id)
+            if current is not None:
+                drift = len(current ^ banned)
+                if drift:
+                    print(f"🔧 Ban index for {guild_id} had drifted by {drift}")
+                self.metrics['drift'] += drift
+                self._guilds[guild_id] = banned
+                self._loaded_at[guild_id] = time.monotonic()
+            self.metrics['reconciles'] += 1
+
+    def stats(self):
+        return dict(
+            self.metrics,
+            guilds=len(self._guilds),
+            banned_ids=sum(len(banned) for banned in self._guilds.values()),
+            loading=len(self._loading),
+        )
+
+
+# Pause between chunk requests, and whether every guild is chunked in the background after startup
+# (off by default: guilds are chunked on demand, when a command first needs their members)
+CHUNK_INTERVAL = float(os.getenv('CHUNK_INTERVAL', '1.0'))
+CHUNK_BACKGROUND = os.getenv('CHUNK_BACKGROUND', '0') == '1'
+
+# Chunk request priorities: a command waiting on the result goes ahead of background prefetch
+INTERACTIVE, BACKGROUND = 0, 1
+
+
+class MemberCounts:
+    """Per-guild bot counts kept current by member join/remove events
+
+    A guild's bots are counted once, from the member cache after it is
+    chunked. From then on on_member_join/on_member_remove adjust the count,
+    and humans is guild.member_count minus bots, so lookups are O(1).
+    """
+
+    def __init__(self):
+        self._bots = {}  # guild_id -> bot count
+        self.rebuilds = 0
+
+    def rebuild(self, guild):
+        self._bots[guild.id] = sum(1 for member in guild.members if member.bot)
+        self.rebuilds += 1
+
+    def get(self, guild):
+        """(humans, bots) for a guild, or None until it has been chunked"""
+        bots = self._bots.get(guild.id)
+        if bots is None:
+            if not guild.chunked:
+                return None
+            self.rebuild(guild)
+            bots = self._bots[guild.id]
+        total = guild.member_count or 0
+        return max(total - bots, 0), bots
+
+    def on_join(self, member):
+        if member.bot and member.guild.id in self._bots:
+            self._bots[member.guild.id] += 1
+
+    def on_remove(self, member):
+        if member.bot and member.guild.id in self._bots:
+            self._bots[member.guild.id] = max(self._bots[member.guild.id] - 1, 0)
+
+    def forget(self, guild_id):
+        self._bots.pop(guild_id, None)
+
+    def stats(self):
+        return {'guilds': len(self._bots), 'rebuilds': self.rebuilds}
+
+
+class ChunkCoordinator:
+    """One queue for all guild chunk requests
+
+    Concurrent requests for the same guild share one chunk. A single worker
+    chunks one guild at a time, pausing `interval` seconds between guilds,
+    and always takes requests a command is waiting on (INTERACTIVE) before
+    background prefetch. Member counts are rebuilt after each chunk.
+    """
+
+    def __init__(self, bot, counts, interval=CHUNK_INTERVAL):
+        self.bot = bot
+        self.counts = counts
+        self.interval = interval
+        self._queue = asyncio.PriorityQueue()
+        self._futures = {}  # guild_id -> Future resolved when its chunk finishes
+        self._priority = {}  # guild_id -> best priority queued
+        self._sequence = 0
+        self._task = None
+        self.metrics = {'requested': 0, 'deduplicated': 0, 'chunked': 0, 'failed': 0}
+
+    def _enqueue(self, guild_id, priority):
+        future = self._futures.get(guild_id)
+        if future is None:
+            future = self._futures[guild_id] = asyncio.get_running_loop().create_future()
+            self.metrics['requested'] += 1
+        else:
+            self.metrics['deduplicated'] += 1
+        # Re-queue at a better priority; the stale entry is skipped when it comes up
+        if priority < self._priority.get(guild_id, BACKGROUND + 1):
+            self._priority[guild_id] = priority
+            self._sequence += 1
+            self._queue.put_nowait((priority, self._sequence, guild_id))
+        return future
+
+    async def request(self, guild, priority=INTERACTIVE):
+        """Wait until a guild is chunked; returns False if chunking failed"""
+        if guild.chunked:
+            return True
+        return await asyncio.shield(self._enqueue(guild.id, priority))
+
+    def prefetch(self, guilds):
+        """Queue background chunking for guilds that aren't chunked yet"""
+        for guild in guilds:
+            if not guild.chunked:
+                self._enqueue(guild.id, BACKGROUND)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        await self.bot.wait_until_ready()
+        while True:
+            priority, _, guild_id = await self._queue.get()
+            future = self._futures.get(guild_id)
+            if future is None or future.done() or priority > self._priority.get(guild_id, priority):
+                continue  # Already handled, or superseded by a higher priority entry
+            guild = self.bot.get_guild(guild_id)
+            chunked = guild is not None and guild.chunked
+            requested = guild is not None and not chunked
+            if requested:
+                try:
+                    await guild.chunk(cache=True)
+                    self.counts.rebuild(guild)
+                    self.metrics['chunked'] += 1
+                    chunked = True
+                except Exception as e:
+                    self.metrics['failed'] += 1
+                    print(f"❌ Failed to chunk guild {guild_id}: {e}")
+            del self._futures[guild_id]
+            del self._priority[guild_id]
+            future.set_result(chunked)
+            if requested:
+                await asyncio.sleep(self.interval)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return dict(self.metrics, queued=len(self._futures))
+
+
+# Fetched user profiles: how long they are kept, how many, and how many fetches run at once
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '3600'))
+USER_CACHE_MAX = int(os.getenv('USER_CACHE_MAX', '10000'))
+USER_FETCH_CONCURRENCY = int(os.getenv('USER_FETCH_CONCURRENCY', '4'))
+
+
+class UserCache:
+    """Shared cache in front of bot.fetch_user
+
+    Profiles (including banners, which the gateway cache lacks) are kept in
+    an ExpiringStore, so entries expire after `ttl` and the oldest are
+    evicted past `max_users`. Unknown IDs are cached too. Concurrent lookups
+    for one ID share a single in-flight fetch, and no more than
+    `concurrency` fetches run at once, prefetches included.
+    """
+
+    def __init__(self, bot, ttl=USER_CACHE_TTL, max_users=USER_CACHE_MAX, concurrency=USER_FETCH_CONCURRENCY):
+        self.bot = bot
+        self._users = ExpiringStore(ttl, max_users)  # user_id -> User, or False if it doesn't exist
+        self._inflight = {}  # user_id -> Task
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.metrics = {'hits': 0, 'misses': 0, 'coalesced': 0, 'not_found': 0, 'errors': 0}
+
+    def peek(self, user_id):
+        """Cached profile without fetching; None if unknown or not cached"""
+        return self._users.get(int(user_id)) or None
+
+    async def _fetch(self, user_id):
+        try:
+            async with self._semaphore:
+                user = await self.bot.fetch_user(user_id)
+        except discord.NotFound:
+            self.metrics['not_found'] += 1
+            user = False
+        self._users.set(user_id, user)
+        return user
+
+    async def get(self, user_id):
+        """Full user profile, or None if no such user exists; other HTTP errors propagate"""
+        user_id = int(user_id)
+        cached = self._users.get(user_id)
+        if cached is not None:
+            self.metrics['hits'] += 1
+            return cached or None
+
+        task = self._inflight.get(user_id)
+        if task is None:
+            self.metrics['misses'] += 1
+            task = self._inflight[user_id] = asyncio.create_task(self._fetch(user_id))
+            task.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        else:
+            self.metrics['coalesced'] += 1
+        return await asyncio.shield(task) or None
+
+    async def prefetch(self, user_ids):
+        """Fetch every uncached ID, `concurrency` at a time; returns {user_id: User or None}"""
+        user_ids = [int(user_id) for user_id in user_ids]
+        results = await asyncio.gather(*(self.get(user_id) for user_id in user_ids), return_exceptions=True)
+        users = {}
+        for user_id, result in zip(user_ids, results):
+            if isinstance(result, Exception):
+                self.metrics['errors'] += 1
+                result = None
+            users[user_id] = result
+        return users
+
+    def stats(self):
+        return dict(self.metrics, inflight=len(self._inflight), **self._users.stats())
@@ -8,27 +8,119 @@ from discord.ext import commands
 from discord import app_commands
 import asyncio
 import os
+import sqlite3
+import tempfile
 import zipfile
 import io
-from utils import has_permissions, get_emoji, create_embed, save_data
-
-@commands.hybrid_command(name='purge', description='Delete multiple messages')
-@app_commands.describe(amount='Number of messages to delete (1-100)')
-async def purge(ctx, amount: int):
+from utils import has_permissions, get_emoji, create_embed, save_record, get_state, json_dumps
+from bulkops import BanReport, BulkPacer, delete_matching, mass_ban, message_filter, parse_user_ids
+from jobs import start_job
+from storage import DB_PATH
+
+# Most messages one purge will check
+PURGE_MAX_SCAN = int(os.getenv('PURGE_MAX_SCAN', '10000'))
+
+class PurgeFlags(commands.FlagConverter):
+    """Optional purge filters, e.g. `purge 500 user: @spammer contains: free nitro`"""
+    user: discord.User = commands.flag(default=None, description='Only delete messages from this user')
+    bots: bool = commands.flag(default=False, description='Only delete messages from bots')
+    contains: str = commands.flag(default=None, description='Only delete messages containing this text')
+    attachments: bool = commands.flag(default=False, description='Only delete messages with attachments')
+    before: str = commands.flag(default=None, description='Only messages before this message ID or link')
+    after: str = commands.flag(default=None, description='Only messages after this message ID or link')
+
+def parse_message_ref(value):
+    """Message ID or message link -> discord.Object, or None if it isn't one"""
+    if value is None:
+        return None
+    tail = value.strip().rstrip('/').rsplit('/', 1)[-1]
+    return discord.Object(id=int(tail)) if tail.isdigit() else None
+
+@commands.hybrid_command(name='purge', description='Delete messages, optionally filtered')
+@app_commands.describe(amount=f'Number of messages to check (1-{PURGE_MAX_SCAN})')
+async def purge(ctx, amount: int, *, flags: PurgeFlags):
     if not await has_permissions(ctx, manage_messages=True):
         embed = create_embed(f"{get_emoji('cross')} No Permission", "You need **Manage Messages** permission!")
         return await ctx.send(embed=embed)
 
-    if amount < 1 or amount > 100:
-        embed = create_embed(f"{get_emoji('cross')} Invalid Amount", "Amount must be between 1 and 100!")
+    if amount < 1 or amount > PURGE_MAX_SCAN:
+        embed = create_embed(f"{get_emoji('cross')} Invalid Amount", f"Amount must be between 1 and {PURGE_MAX_SCAN}!")
+        return await ctx.send(embed=embed)
+
+    before, after = parse_message_ref(flags.before), parse_message_ref(flags.after)
+    if (flags.before and not before) or (flags.after and not after):
+        embed = create_embed(f"{get_emoji('cross')} Invalid Message", "**before**/**after** must be a message ID or link!")
         return await ctx.send(embed=embed)
 
-    deleted = await ctx.channel.purge(limit=amount + 1)  # +1 to include command message
+    # The command message is removed separately, so prefix and slash purges count the same messages
+    if ctx.interaction is None:
+        try:
+            await ctx.message.delete()
+        except discord.HTTPException:
+            pass
+
+    await start_job(ctx, 'purge', {
+        'amount': amount,
+        'user_id': flags.user.id if flags.user else None,
+        'bots': flags.bots,
+        'contains': flags.contains,
+        'attachments': flags.attachments,
+        'before': before.id if before else None,
+        'after': after.id if after else None,
+    })
+
+class HistoryResume:
+    """Where a history-scanning job continues after a restart
+
+    job.cursor is the last message earlier runs handled and job.done how many
+    messages they checked, so a rerun scans only the rest of the original range
+    instead of reaching further back into messages that were never in scope.
+    """
+
+    def __init__(self, job, before_id, amount):
+        self.job = job
+        self.scanned = job.done
+        self.failed = job.failed
+        self.before = discord.Object(id=job.cursor or before_id)
+        self.limit = amount - self.scanned
+
+    def checkpoint(self, message_id, result):
+        self.job.checkpoint(cursor=message_id, done=self.scanned + result.scanned, failed=self.failed + result.failed)
+
+    def finish(self, result):
+        """Record the final counts; returns the summary text"""
+        self.job.checkpoint(done=self.scanned + result.scanned, failed=self.failed + result.failed)
+        text = result.summary()
+        if self.scanned:
+            text += f"\nContinued after **{self.scanned}** messages checked before a restart"
+        return text
+
+async def run_purge(bot, job):
+    """purge job: stream history below the status message through the filters"""
+    params = job.params
+    channel = bot.get_channel(job.channel_id) or await bot.fetch_channel(job.channel_id)
+    user = discord.Object(id=params['user_id']) if params['user_id'] else None
+    check = message_filter(user, params['bots'], params['contains'], params['attachments'])
+    resume = HistoryResume(job, params['before'] or job.message_id, params['amount'])
+    after = discord.Object(id=params['after']) if params['after'] else None
+    await job.status.update(f"Checking up to **{resume.limit}** messages...")
+
+    try:
+        result = await delete_matching(
+            channel,
+            channel.history(limit=max(resume.limit, 0), before=resume.before, after=after, oldest_first=False),
+            check,
+            progress=job.status,
+            reason=f"Purge job #{job.id}",
+            pacer=BulkPacer(bot.backpressure),
+            cancelled=job.cancelled,
+            checkpoint=resume.checkpoint
+        )
+    except discord.Forbidden:
+        return await job.status.finish(f"{get_emoji('cross')} Error", "I don't have permission to delete messages here!")
 
-    embed = create_embed(f"{get_emoji('tick')} Messages Purged", f"Deleted **{len(deleted)-1}** messages")
-    message = await ctx.send(embed=embed)
-    await asyncio.sleep(3)
-    await message.delete()
+    await job.status.finish(f"{get_emoji('tick')} Messages Purged", resume.finish(result), delete_after=5)
+    return result.cancelled
 
 @commands.hybrid_command(name='cbot', description='Delete bot messages from the channel')
 @app_commands.describe(amount='Number of messages to check (default: 50)')
@@ -37,19 +129,33 @@ async def cbot(ctx, amount: int = 50):
         embed = create_embed(f"{get_emoji('cross')} No Permission", "You need **Manage Messages** permission!")
         return await ctx.send(embed=embed)
 
-    deleted = 0
-    async for message in ctx.channel.history(limit=amount):
-        if message.author.bot:
-            try:
-                await message.delete()
-                deleted += 1
-            except:
-                continue
+    if amount < 1:
+        embed = create_embed(f"{get_emoji('cross')} Invalid Amount", "Amount must be at least 1!")
+        return await ctx.send(embed=embed)
 
-    embed = create_embed(f"{get_emoji('tick')} Bot Messages Cleared", f"Deleted **{deleted}** bot messages")
-    message = await ctx.send(embed=embed)
-    await asyncio.sleep(3)
-    await message.delete()
+    await start_job(ctx, 'cbot', {'amount': amount}, cancellable=False)
+
+async def run_cbot(bot, job):
+    """cbot job: bot messages are collected 100 at a time and bulk deleted, not deleted one by one"""
+    channel = bot.get_channel(job.channel_id) or await bot.fetch_channel(job.channel_id)
+    resume = HistoryResume(job, job.message_id, job.params['amount'])
+    await job.status.update(f"Checking the last **{resume.limit}** messages...")
+    try:
+        result = await delete_matching(
+            channel,
+            channel.history(limit=max(resume.limit, 0), before=resume.before),
+            lambda message: message.author.bot,
+            progress=job.status,
+            reason=f"cbot job #{job.id}",
+            pacer=BulkPacer(bot.backpressure),
+            cancelled=job.cancelled,
+            checkpoint=resume.checkpoint
+        )
+    except discord.Forbidden:
+        return await job.status.finish(f"{get_emoji('cross')} Error", "I don't have permission to delete messages here!")
+
+    await job.status.finish(f"{get_emoji('tick')} Bot Messages Cleared", resume.finish(result), delete_after=5)
+    return result.cancelled
 
 @commands.hybrid_command(name='lock', description='Lock a channel')
 @app_commands.describe(channel='Channel to lock (optional)')
@@ -165,13 +271,9 @@ async def setprefix(ctx, prefix: str):
 
     guild_id = str(ctx.guild.id)
 
-    # Update global guild_prefixes
-    global guild_prefixes
-    guild_prefixes[guild_id] = prefix
-
-    # Update bot data
-    ctx.bot.data['guild_prefixes'] = guild_prefixes
-    save_data(ctx.bot.data)
+    # Update bot data in place - main.guild_prefixes shares this dict
+    ctx.bot.data.setdefault('guild_prefixes', {})[guild_id] = prefix
+    save_record(ctx.bot.data, 'guild_prefixes', guild_id)
 
     embed = create_embed(f"{get_emoji('tick')} Prefix Changed", f"Server prefix changed to: **{prefix}**")
     await ctx.send(embed=embed)
@@ -194,7 +296,7 @@ async def noprefix(ctx, user: discord.Member):
 
     # Save data
     ctx.bot.data['no_prefix_users'] = list(ctx.bot.no_prefix_users)
-    save_data(ctx.bot.data)
+    save_record(ctx.bot.data, 'no_prefix_users')
     await ctx.send(embed=embed)
 
 @commands.hybrid_command(name='npusers', description='Show users with no-prefix permissions')
@@ -209,15 +311,20 @@ async def npusers(ctx):
 
     embed = create_embed("👑 No-Prefix Users", f"Users with no-prefix permissions: **{len(ctx.bot.no_prefix_users)}**")
 
+    # Fetch everyone not already cached in one bounded batch, then render in one pass
+    cache = ctx.bot.user_cache
+    missing = [user_id for user_id in ctx.bot.no_prefix_users
+               if ctx.bot.get_user(int(user_id)) is None and cache.peek(user_id) is None]
+    if missing:
+        await cache.prefetch(missing)
+
     user_list = []
     for user_id in ctx.bot.no_prefix_users:
-        try:
-            user = await ctx.bot.fetch_user(user_id)
+        user = ctx.bot.get_user(int(user_id)) or cache.peek(user_id)
+        if user:
             user_list.append(f"• **{user}** (ID: {user_id})")
-        except discord.NotFound:
+        else:
             user_list.append(f"• **Unknown User** (ID: {user_id})")
-        except Exception:
-            user_list.append(f"• **Error fetching user** (ID: {user_id})")
 
     if user_list:
         # Split into chunks if too many users
@@ -228,44 +335,78 @@ async def npusers(ctx):
     await ctx.send(embed=embed)
 
 @commands.hybrid_command(name='massban', description='Ban multiple users')
-@app_commands.describe(user_ids='User IDs to ban separated by spaces', reason='Reason for ban')
+@app_commands.describe(user_ids='User IDs or mentions to ban, separated by spaces', reason='Reason for ban')
 async def massban(ctx, user_ids: str, *, reason: str = "Mass ban"):
     if not await has_permissions(ctx, ban_members=True):
         embed = create_embed(f"{get_emoji('cross')} No Permission", "You need **Ban Members** permission!")
         return await ctx.send(embed=embed)
 
-    ids = user_ids.split()
-    success_count = 0
-    failed_count = 0
+    ids, invalid = parse_user_ids(user_ids)
+    if not ids:
+        embed = create_embed(f"{get_emoji('cross')} Invalid IDs", "Please provide user IDs or mentions separated by spaces!")
+        return await ctx.send(embed=embed)
 
+    # Never ban ourselves, the invoker, the owner, or cached members at or above the invoker
+    report = BanReport()
+    protected = {ctx.author.id, ctx.guild.owner_id, ctx.bot.user.id}
+    targets = []
     for user_id in ids:
-        try:
-            user_id = int(user_id)
-            user = await ctx.bot.fetch_user(user_id)
-            await ctx.guild.ban(user, reason=f"{reason} - By {ctx.author}")
-            success_count += 1
-        except ValueError:
-            print(f"Invalid user ID: {user_id}")
-            failed_count += 1
-            continue
-        except discord.NotFound:
-            print(f"User not found: {user_id}")
-            failed_count += 1
-            continue
-        except discord.Forbidden:
-            print(f"No permission to ban user: {user_id}")
-            failed_count += 1
-            continue
-        except Exception as e:
-            print(f"Error banning user {user_id}: {e}")
-            failed_count += 1
-            continue
-
-    embed = create_embed(
-        f"{get_emoji('tick')} Mass Ban Complete",
-        f"**Banned:** {success_count}\n**Failed:** {failed_count}\n**Reason:** {reason}"
+        member = ctx.guild.get_member(user_id)
+        if user_id in protected:
+            report.add(user_id, 'skipped', 'protected user')
+        elif member and ctx.author.id != ctx.guild.owner_id and member.top_role >= ctx.author.top_role:
+            report.add(user_id, 'skipped', 'role is not below yours')
+        else:
+            targets.append(user_id)
+
+    await start_job(ctx, 'massban', {
+        'targets': targets,
+        'skipped': {str(user_id): detail for user_id, (_, detail) in report.results.items()},
+        'invalid': invalid,
+        'reason': f"{reason} - By {ctx.author}",
+        'display_reason': reason,
+    }, cancellable=False)
+
+async def run_massban(bot, job):
+    """massban job; job.cursor counts targets already sent through bulk ban, so a resume skips them"""
+    params = job.params
+    guild = bot.get_guild(job.guild_id)
+    if guild is None:
+        raise RuntimeError("I'm no longer in this server")
+
+    report = BanReport()
+    for user_id, detail in params['skipped'].items():
+        report.add(int(user_id), 'skipped', detail)
+    targets = params['targets'][job.cursor:]
+    await job.status.update(f"Banning **{len(targets)}** users...")
+
+    offset, done, failed = job.cursor, job.done, job.failed
+    report = await mass_ban(
+        guild,
+        targets,
+        reason=params['reason'],
+        progress=job.status,
+        pacer=BulkPacer(bot.backpressure),
+        report=report,
+        checkpoint=lambda handled, progress: job.checkpoint(
+            offset + handled, done + progress.count('banned'), failed + progress.count('failed')),
+        cancelled=job.cancelled
     )
-    await ctx.send(embed=embed)
+    job.checkpoint(len(params['targets']), done + report.count('banned'), failed + report.count('failed'))
+
+    summary = f"{report.summary()}\n**Reason:** {params['display_reason']}"
+    if params['invalid']:
+        summary += f"\n**Invalid IDs:** {len(params['invalid'])}"
+    if report.cancelled:
+        await job.status.finish(f"{get_emoji('cross')} Mass Ban Cancelled", summary)
+    else:
+        await job.status.finish(f"{get_emoji('tick')} Mass Ban Complete", summary)
+
+    # Per-ID results whenever anything didn't go through
+    if params['invalid'] or report.count('banned') < len(report.results):
+        file = discord.File(io.BytesIO(report.to_json(params['invalid'])), filename=f"massban_report_{job.id}.json")
+        await bot.get_partial_messageable(job.channel_id).send(file=file)
+    return report.cancelled
 
 @commands.hybrid_command(name='leaveguild', description='Make the bot leave a server by guild ID (owner only)')
 @commands.is_owner()
@@ -418,14 +559,25 @@ async def vcunhide(ctx, channel: discord.VoiceChannel = None):
 @commands.hybrid_command(name="backup", description="📦 Backup bot's core files (Owner only)")
 @commands.is_owner()
 async def backup(ctx):
-    await ctx.defer()  # Defers response for slash command
+    await start_job(ctx, 'backup', {}, cancellable=False)
 
+def build_backup(snapshot_name, snapshot):
+    """Zip the backup files and the state snapshot (runs on a worker thread)"""
     important_files = [
         "main.py",
         "utils.py",
+        "storage.py",
+        "migrations.py",
+        "ratelimit.py",
+        "dispatch.py",
+        "caches.py",
+        "scheduler.py",
+        "stores.py",
+        "bulkops.py",
+        "jobs.py",
         "embedbuilder.py", 
         "data.json",
-        "data_backup.json",
+        "data.journal",
         "requirements.txt",
         "pyproject.toml",
         "start_bot.py",
@@ -445,39 +597,105 @@ async def backup(ctx):
         "HOSTING_README.md"
     ]
 
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        # Add important files
+        for file in important_files:
+            if os.path.exists(file):
+                zip_file.write(file)
+
+        # Live in-memory state, which can be ahead of what has been flushed to disk
+        zip_file.writestr(snapshot_name, snapshot)
+
+        # kabu.db is live and in WAL mode, so copying the file could miss the -wal
+        # contents; SQLite's backup API gives a consistent copy instead
+        if os.path.exists(DB_PATH):
+            with tempfile.TemporaryDirectory() as tmp:
+                copy_path = os.path.join(tmp, os.path.basename(DB_PATH))
+                source, target = sqlite3.connect(DB_PATH), sqlite3.connect(copy_path)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                    source.close()
+                zip_file.write(copy_path, arcname=os.path.basename(DB_PATH))
+
+        # Add commands directory and per-guild data shards
+        for directory in ('commands', 'guild_data'):
+            for root, dirs, files in os.walk(directory):
+                for file in files:
+                    file_path = os.path.join(root, file)
+                    if os.path.exists(file_path):
+                        zip_file.write(file_path)
+
+    zip_buffer.seek(0)
+    return zip_buffer
+
+async def run_backup(bot, job):
+    """backup job: snapshot the state on the loop, compress off it"""
+    await job.status.update("Compressing files...")
     try:
-        # Create zip in memory
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-            # Add important files
-            for file in important_files:
-                if os.path.exists(file):
-                    zip_file.write(file)
-
-            # Add commands directory
-            if os.path.exists('commands'):
-                for root, dirs, files in os.walk('commands'):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        if os.path.exists(file_path):
-                            zip_file.write(file_path)
-
-        zip_buffer.seek(0)
+        version, snapshot = get_state().snapshot()
+        zip_buffer = await asyncio.to_thread(build_backup, f"state_snapshot_v{version}.json", json_dumps(snapshot))
 
         # Check if any files were actually added
         if zip_buffer.getvalue():
             # Send the zip file
-            await ctx.send("✅ Backup created successfully!", file=discord.File(fp=zip_buffer, filename="kabu_backup.zip"))
+            await bot.get_partial_messageable(job.channel_id).send(
+                "✅ Backup created successfully!", file=discord.File(fp=zip_buffer, filename="kabu_backup.zip"))
+            await job.status.finish(f"{get_emoji('tick')} Backup Complete", f"Job `#{job.id}` finished", delete_after=5)
         else:
-            embed = create_embed(f"{get_emoji('cross')} Backup Failed", "No files found to backup!")
-            await ctx.send(embed=embed)
+            await job.status.finish(f"{get_emoji('cross')} Backup Failed", "No files found to backup!")
 
     except Exception as e:
-        embed = create_embed(f"{get_emoji('cross')} Backup Error", f"Failed to create backup: {str(e)}")
-        await ctx.send(embed=embed)
+        await job.status.finish(f"{get_emoji('cross')} Backup Error", f"Failed to create backup: {str(e)}")
+
+@commands.hybrid_command(name='jobs', description='Show running, queued and recent background jobs')
+async def jobs(ctx):
+    if not await has_permissions(ctx, manage_messages=True):
+        embed = create_embed(f"{get_emoji('cross')} No Permission", "You need **Manage Messages** permission!")
+        return await ctx.send(embed=embed)
+
+    active, recent = ctx.bot.jobs.guild_jobs(ctx.guild.id)
+    embed = create_embed(f"{get_emoji('list')} Jobs", None if active or recent else "No jobs in this server yet")
+    if active:
+        embed.add_field(name="Active", value="\n".join(job.describe() for job in active[:15]), inline=False)
+    if recent:
+        embed.add_field(name="Recent", value="\n".join(job.describe() for job in recent), inline=False)
+    await ctx.send(embed=embed)
+
+@commands.hybrid_command(name='jobcancel', description='Cancel a queued or running background job')
+@app_commands.describe(job_id='Job number shown by the jobs command')
+async def jobcancel(ctx, job_id: int):
+    if not await has_permissions(ctx, manage_messages=True):
+        embed = create_embed(f"{get_emoji('cross')} No Permission", "You need **Manage Messages** permission!")
+        return await ctx.send(embed=embed)
+
+    job = ctx.bot.jobs.get(job_id)
+    if job is None or job.guild_id != ctx.guild.id or job.state not in ('queued', 'running'):
+        embed = create_embed(f"{get_emoji('cross')} Job Not Found", f"No active job `#{job_id}` in this server!")
+        return await ctx.send(embed=embed)
+
+    # Only whoever started a job, or an administrator, can stop it
+    if job.author_id != ctx.author.id and not await has_permissions(ctx, administrator=True):
+        embed = create_embed(f"{get_emoji('cross')} No Permission", "Only the job's author or an **Administrator** can cancel it!")
+        return await ctx.send(embed=embed)
+
+    if ctx.bot.jobs.cancel(job_id) is None:
+        embed = create_embed(f"{get_emoji('cross')} Can't Cancel", f"Job `#{job_id}` ({job.kind}) can't be stopped once it has started")
+        return await ctx.send(embed=embed)
+    if job.state == 'running':
+        embed = create_embed(f"{get_emoji('tick')} Job Cancelled", f"Job `#{job_id}` ({job.kind}) will stop at its next step")
+    else:
+        embed = create_embed(f"{get_emoji('tick')} Job Cancelled", f"Job `#{job_id}` ({job.kind}) was cancelled before it started")
+    await ctx.send(embed=embed)
 
 async def setup(bot):
     """Add admin commands to bot"""
+    bot.jobs.register('purge', run_purge, 'Purging Messages')
+    bot.jobs.register('cbot', run_cbot, 'Clearing Bot Messages')
+    bot.jobs.register('massban', run_massban, 'Mass Ban')
+    bot.jobs.register('backup', run_backup, 'Backup', cancellable=False)
     bot.add_command(purge)
     bot.add_command(cbot)
     bot.add_command(lock)
@@ -494,5 +712,7 @@ async def setup(bot):
     bot.add_command(dm_user)
     bot.add_command(listallcmds)
     bot.add_command(backup)
+    bot.add_command(jobs)
+    bot.add_command(jobcancel)
     bot.add_command(vchide)
     bot.add_command(vcunhide)
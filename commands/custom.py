@@ -3,7 +3,7 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 from discord.ui import View, Select
-from utils import has_permissions, get_emoji, create_embed, save_data, load_data
+from utils import has_permissions, get_emoji, create_embed, save_record
 
 # Dropdown View for Embed Selection
 class EmbedDropdownView(View):
@@ -75,10 +75,7 @@ class EmbedDropdown(Select):
                     self.bot.data['welcome'][guild_id]['message'] = message
                     message_status = f"\n**Custom Message:** Set"
 
-            save_data(self.bot.data)
-                        
-            # Force sync the data to ensure persistence
-            self.bot.data = load_data()
+            save_record(self.bot.data, 'welcome', guild_id)
 
             embed = create_embed(
                 f"{get_emoji('tick')} Welcome Configured",
@@ -194,7 +191,7 @@ Contains custom role commands, aliases, embed management, and welcome system
 import discord
 from discord.ext import commands
 from discord import app_commands
-from utils import has_permissions, get_emoji, create_embed, save_data
+from utils import has_permissions, get_emoji, create_embed, save_record
 
 @commands.hybrid_command(name='listcmds', description='List all custom commands')
 async def listcmds(ctx):
@@ -207,7 +204,7 @@ async def listcmds(ctx):
 
     command_list = []
     for cmd_name, cmd_data in custom_commands.items():
-        role_name = cmd_data.get('role_name', 'Unknown Role')
+        role_name = cmd_data.get('role_name', 'Unknown Role') if isinstance(cmd_data, dict) else 'Unknown Role'
         command_list.append(f"**{cmd_name}** - Assigns `{role_name}` role")
 
     embed = create_embed(
@@ -303,7 +300,8 @@ async def addcmd(ctx, name: str, role: discord.Role, *, description: str = "Cust
 
     # Save data
     ctx.bot.data['custom_commands'] = ctx.bot.custom_commands
-    save_data(ctx.bot.data)
+    save_record(ctx.bot.data, 'custom_commands', guild_id, name.lower())
+    ctx.bot.dispatch_index.invalidate(guild_id)
 
     embed = create_embed(
         f"{get_emoji('tick')} Custom Command Added",
@@ -330,7 +328,8 @@ async def delcmd(ctx, name: str):
 
         # Save data
         ctx.bot.data['custom_commands'] = ctx.bot.custom_commands
-        save_data(ctx.bot.data)
+        save_record(ctx.bot.data, 'custom_commands', guild_id, name.lower())
+        ctx.bot.dispatch_index.invalidate(guild_id)
 
         embed = create_embed(f"{get_emoji('tick')} Custom Command Deleted", f"Command **{name}** has been deleted")
         await ctx.send(embed=embed)
@@ -361,7 +360,8 @@ async def addalias(ctx, alias: str, *, command: str):
 
     # Add the alias
     ctx.bot.data['aliases'][guild_id][alias.lower()] = command.lower()
-    save_data(ctx.bot.data)
+    save_record(ctx.bot.data, 'aliases', guild_id, alias.lower())
+    ctx.bot.dispatch_index.invalidate(guild_id)
 
     embed = create_embed(
         f"{get_emoji('tick')} Alias Added",
@@ -386,7 +386,8 @@ async def delalias(ctx, alias: str):
 
     # Remove the alias
     del ctx.bot.data['aliases'][guild_id][alias.lower()]
-    save_data(ctx.bot.data)
+    save_record(ctx.bot.data, 'aliases', guild_id, alias.lower())
+    ctx.bot.dispatch_index.invalidate(guild_id)
 
     embed = create_embed(f"{get_emoji('tick')} Alias Deleted", f"Alias **{alias}** has been deleted")
     await ctx.send(embed=embed)
@@ -473,7 +474,7 @@ async def embeddel(ctx, *, name: str):
 
     # Delete the embed
     del ctx.bot.data['embeds'][guild_id][name]
-    save_data(ctx.bot.data)
+    save_record(ctx.bot.data, 'embeds', guild_id, name)
 
     embed = create_embed(f"{get_emoji('tick')} Embed Deleted", f"Embed **{name}** has been deleted")
     await ctx.send(embed=embed)
@@ -593,7 +594,7 @@ async def delwelcome(ctx):
 
     if 'welcome' in ctx.bot.data and guild_id in ctx.bot.data['welcome']:
         del ctx.bot.data['welcome'][guild_id]
-        save_data(ctx.bot.data)
+        save_record(ctx.bot.data, 'welcome', guild_id)
         embed = create_embed(f"{get_emoji('tick')} Welcome Removed", "Welcome system has been disabled and configuration removed")
     else:
         embed = create_embed(f"{get_emoji('info')} Not Configured", "Welcome system is not configured for this server")
@@ -615,7 +616,7 @@ async def togglewelcome(ctx):
     # Toggle enabled status
     current_status = ctx.bot.data['welcome'][guild_id].get('enabled', False)
     ctx.bot.data['welcome'][guild_id]['enabled'] = not current_status
-    save_data(ctx.bot.data)
+    save_record(ctx.bot.data, 'welcome', guild_id)
 
     status = "enabled" if not current_status else "disabled"
     embed = create_embed(f"{get_emoji('tick')} Welcome {status.title()}", f"Welcome system has been {status}")
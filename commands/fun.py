@@ -167,12 +167,37 @@ async def remind(ctx, time: str, *, message: str = "Reminder"):
         embed = create_embed(f"{get_emoji('cross')} Invalid Time", "Use format like: 10m, 1h, 2d")
         return await ctx.send(embed=embed)
     
+    # Stored in the timer scheduler so it still fires after a restart
+    set_at = int(discord.utils.utcnow().timestamp())
+    due = set_at + duration
+    ctx.bot.scheduler.schedule('reminder', due, {
+        'channel_id': ctx.channel.id,
+        'user_id': ctx.author.id,
+        'message': message[:1000],
+        'set_at': set_at,
+    })
+
     embed = create_embed(
         f"{get_emoji('tick')} Reminder Set",
-        f"I'll remind you about: **{message}**\nIn: **{time}**"
+        f"I'll remind you about: **{message[:1000]}**\nIn: **{time}** (<t:{due}:R>)"
     )
     await ctx.send(embed=embed)
 
+def make_reminder_handler(bot):
+    """Timer handler that delivers a reminder in the channel it was set in"""
+    async def send_reminder(payload):
+        channel = bot.get_partial_messageable(payload['channel_id'])
+        embed = create_embed(
+            f"{get_emoji('tick')} Reminder",
+            f"**{payload['message']}**\nSet <t:{payload['set_at']}:R>"
+        )
+        await channel.send(
+            content=f"<@{payload['user_id']}>",
+            embed=embed,
+            allowed_mentions=discord.AllowedMentions(users=True, roles=False, everyone=False)
+        )
+    return send_reminder
+
 class TicTacToeButton(discord.ui.Button):
     def __init__(self, x, y):
         super().__init__(label="‎ ", style=discord.ButtonStyle.secondary, row=y)
@@ -273,7 +298,6 @@ async def ttt(ctx, opponent: discord.Member):
     view = TicTacToe(ctx.author, opponent)
     await ctx.send(embed=embed, view=view)
     
-    # Note: Full reminder implementation would require background tasks
 @commands.hybrid_command(name="nickn", description="Change or reset someone's nickname (if allowed by role hierarchy)")
 @app_commands.describe(user="The user whose nickname you want to change or reset", nickname="The new nickname (leave empty to reset)")
 async def nickn(ctx, user: discord.Member, *, nickname: str = None):
@@ -325,5 +349,6 @@ async def setup(bot):
     bot.add_command(fact)
     bot.add_command(poll)
     bot.add_command(remind)
+    bot.scheduler.register('reminder', make_reminder_handler(bot))
     bot.add_command(ttt)
     bot.add_command(nickn)
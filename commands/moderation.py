@@ -8,6 +8,7 @@ from discord.ext import commands
 from discord import app_commands
 from datetime import timedelta
 from utils import has_permissions, get_emoji, create_embed, parse_time
+from stores import WARNINGS_PER_PAGE
 
 class ModerationConfirmView(discord.ui.View):
     def __init__(self, action_type, target_user, moderator, reason, timeout=30):
@@ -170,12 +171,14 @@ async def unban(ctx, user_id: str, *, reason: str = "No reason provided"):
     
     try:
         user_id = int(user_id)
-        user = await ctx.bot.fetch_user(user_id)
-        await ctx.guild.unban(user, reason=f"{reason} - By {ctx.author}")
+        # Unbanning only needs the ID; the name is shown only if it is already cached
+        await ctx.guild.unban(discord.Object(id=user_id), reason=f"{reason} - By {ctx.author}")
+        user = ctx.bot.get_user(user_id) or ctx.bot.user_cache.peek(user_id)
+        name = f"**{user}**" if user else f"<@{user_id}>"
         
         embed = create_embed(
             f"{get_emoji('tick')} User Unbanned",
-            f"**{user}** has been unbanned\n**Reason:** {reason}"
+            f"{name} has been unbanned\n**Reason:** {reason}"
         )
         await ctx.send(embed=embed)
     except ValueError:
@@ -195,24 +198,7 @@ async def warn(ctx, user: discord.Member, *, reason: str = "No reason provided")
         embed = create_embed(f"{get_emoji('cross')} No Permission", "You need **Kick Members** permission!")
         return await ctx.send(embed=embed)
     
-    guild_id = str(ctx.guild.id)
-    user_id = str(user.id)
-    
-    # Initialize warning system
-    if guild_id not in ctx.bot.user_warnings:
-        ctx.bot.user_warnings[guild_id] = {}
-    if user_id not in ctx.bot.user_warnings[guild_id]:
-        ctx.bot.user_warnings[guild_id][user_id] = []
-    
-    # Add warning
-    warning = {
-        'reason': reason,
-        'moderator': str(ctx.author),
-        'timestamp': discord.utils.utcnow().isoformat()
-    }
-    ctx.bot.user_warnings[guild_id][user_id].append(warning)
-    
-    warning_count = len(ctx.bot.user_warnings[guild_id][user_id])
+    warning_count = ctx.bot.warnings.add(ctx.guild.id, user.id, ctx.author.id, str(ctx.author), reason)
     
     embed = create_embed(
         f"{get_emoji('warning')} User Warned",
@@ -221,28 +207,32 @@ async def warn(ctx, user: discord.Member, *, reason: str = "No reason provided")
     await ctx.send(embed=embed)
 
 @commands.hybrid_command(name='warnings', description='Check user warnings')
-@app_commands.describe(user='User to check warnings for')
-async def warnings(ctx, user: discord.Member = None):
+@app_commands.describe(user='User to check warnings for', page='Page of warnings to show (newest first)')
+async def warnings(ctx, user: discord.Member = None, page: int = 1):
     if not user:
         user = ctx.author
     
-    guild_id = str(ctx.guild.id)
-    user_id = str(user.id)
-    
-    if guild_id not in ctx.bot.user_warnings or user_id not in ctx.bot.user_warnings[guild_id]:
+    total = ctx.bot.warnings.count(ctx.guild.id, user.id)
+    if not total:
         embed = create_embed(f"{get_emoji('tick')} No Warnings", f"**{user}** has no warnings!")
         return await ctx.send(embed=embed)
     
-    warnings = ctx.bot.user_warnings[guild_id][user_id]
+    pages = (total + WARNINGS_PER_PAGE - 1) // WARNINGS_PER_PAGE
+    page = min(max(page, 1), pages)
     warning_list = []
     
-    for i, warning in enumerate(warnings[-10:], 1):  # Show last 10 warnings
-        warning_list.append(f"**{i}.** {warning['reason']} - *by {warning['moderator']}*")
+    # Numbered oldest-first, so #1 is always the user's first warning
+    number = total - (page - 1) * WARNINGS_PER_PAGE
+    for warning in ctx.bot.warnings.page(ctx.guild.id, user.id, page):
+        warning_list.append(f"**{number}.** {warning.reason} - *by {warning.moderator}* <t:{int(warning.created)}:R>")
+        number -= 1
     
     embed = create_embed(
         f"{get_emoji('warning')} User Warnings",
-        f"**{user}** has **{len(warnings)}** warning(s)\n\n" + "\n".join(warning_list)
+        f"**{user}** has **{total}** warning(s)\n\n" + "\n".join(warning_list)
     )
+    if pages > 1:
+        embed.add_field(name="Page", value=f"{page}/{pages}", inline=False)
     await ctx.send(embed=embed)
 
 @commands.hybrid_command(name='clearwarns', description='Clear all warnings for a user')
@@ -252,12 +242,9 @@ async def clearwarns(ctx, user: discord.Member):
         embed = create_embed(f"{get_emoji('cross')} No Permission", "You need **Administrator** permission!")
         return await ctx.send(embed=embed)
     
-    guild_id = str(ctx.guild.id)
-    user_id = str(user.id)
-    
-    if guild_id in ctx.bot.user_warnings and user_id in ctx.bot.user_warnings[guild_id]:
-        del ctx.bot.user_warnings[guild_id][user_id]
-        embed = create_embed(f"{get_emoji('tick')} Warnings Cleared", f"All warnings for **{user}** have been cleared")
+    cleared = ctx.bot.warnings.clear(ctx.guild.id, user.id)
+    if cleared:
+        embed = create_embed(f"{get_emoji('tick')} Warnings Cleared", f"All **{cleared}** warning(s) for **{user}** have been cleared")
     else:
         embed = create_embed(f"{get_emoji('info')} No Warnings", f"**{user}** has no warnings to clear")
     
@@ -6,8 +6,10 @@ Contains role creation, assignment, removal, and custom role commands
 import discord
 from discord.ext import commands
 from discord import app_commands
-from utils import has_permissions, get_emoji, create_embed, parse_role_input, save_data
-from datetime import datetime
+from utils import has_permissions, get_emoji, create_embed, parse_role_input, parse_time, save_record
+from datetime import datetime, timezone
+from bulkops import BulkPacer, RoleResult, apply_role, member_query, select_members
+from jobs import start_job
 
 # Role Management Commands
 @commands.hybrid_command(name='addrole', description='Add role to a user')
@@ -130,15 +132,81 @@ async def deleterole(ctx, *, role: str):
         embed = create_embed(f"{get_emoji('cross')} Error", "I don't have permission to delete this role!")
         await ctx.send(embed=embed)
 
-@commands.hybrid_command(name='massrole', description='Add role to multiple users')
-@app_commands.describe(role='Role to add', users='Users to add role to (mention them)')
-async def massrole(ctx, role: str, users: commands.Greedy[discord.Member]):
+class MassRoleFlags(commands.FlagConverter):
+    """Target query for massrole, e.g. `massrole @Verified has: @Member joined_after: 7d bots: no`"""
+    action: str = commands.flag(default='add', description='add or remove')
+    has: discord.Role = commands.flag(default=None, description='Only members that have this role')
+    joined_after: str = commands.flag(default=None, description='Only members who joined after a date (YYYY-MM-DD) or within a time (e.g. 7d)')
+    bots: bool = commands.flag(default=None, description='Only bots (yes) or only humans (no)')
+    everyone: bool = commands.flag(default=False, description='Target every member when no users or filters are given')
+
+def parse_joined_after(value):
+    """'YYYY-MM-DD' or a duration like '7d' -> unix timestamp, or None if invalid"""
+    duration = parse_time(value)
+    if duration:
+        return discord.utils.utcnow().timestamp() - duration
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return None
+
+async def run_massrole(bot, job):
+    """massrole job: re-query the member cache above job.cursor and update the rest"""
+    params = job.params
+    guild = bot.get_guild(job.guild_id)
+    role = guild.get_role(params['role_id']) if guild else None
+    if role is None or role >= guild.me.top_role:
+        raise RuntimeError("the role was deleted or is now above my role")
+
+    # Targets come from the member cache, so it has to be complete
+    if not await bot.chunker.request(guild):
+        raise RuntimeError("couldn't load the member list")
+
+    check = member_query(role, params['action'], params.get('user_ids'), params.get('has_role_id'),
+                         params.get('joined_after'), params.get('bots'))
+    members = select_members(guild, check, job.cursor)
+    result = RoleResult(job.done, job.failed, job.cursor)
+    await job.status.update(result.summary(len(members)))
+
+    result = await apply_role(
+        members, role, params['action'],
+        reason=params['reason'],
+        result=result,
+        progress=job.status,
+        pacer=BulkPacer(bot.backpressure),
+        checkpoint=lambda progress: job.checkpoint(progress.cursor, progress.done, progress.failed),
+        cancelled=job.cancelled
+    )
+
+    verb = "added to" if params['action'] == 'add' else "removed from"
+    await job.status.finish(
+        f"{get_emoji('tick')} Mass Role Complete",
+        f"{role.mention} {verb} members\n{result.summary()}"
+    )
+    return result.cancelled
+
+@commands.hybrid_command(name='massrole', description='Add or remove a role for many members')
+@app_commands.describe(role='Role to add or remove', users='Users to update (mention them), or use the filters')
+async def massrole(ctx, role: str, users: commands.Greedy[discord.Member], *, flags: MassRoleFlags):
     if not await has_permissions(ctx, manage_roles=True):
         embed = create_embed(f"{get_emoji('cross')} No Permission", "You need **Manage Roles** permission!")
         return await ctx.send(embed=embed)
     
-    if not users:
-        embed = create_embed(f"{get_emoji('cross')} No Users", "Please mention users to add the role to!")
+    action = flags.action.lower()
+    if action not in ('add', 'remove'):
+        embed = create_embed(f"{get_emoji('cross')} Invalid Action", "Action must be **add** or **remove**!")
+        return await ctx.send(embed=embed)
+    
+    joined_after = None
+    if flags.joined_after:
+        joined_after = parse_joined_after(flags.joined_after)
+        if joined_after is None:
+            embed = create_embed(f"{get_emoji('cross')} Invalid Date", "Use a date like **2024-01-31** or a time like **7d**!")
+            return await ctx.send(embed=embed)
+    
+    # Without users or a filter this would hit the whole guild, so that has to be asked for
+    if not users and flags.has is None and joined_after is None and flags.bots is None and not flags.everyone:
+        embed = create_embed(f"{get_emoji('cross')} No Targets", "Mention users, add a filter (**has:**, **joined_after:**, **bots:**) or use **everyone: yes**!")
         return await ctx.send(embed=embed)
     
     role_obj = parse_role_input(ctx.guild, role)
@@ -151,47 +219,17 @@ async def massrole(ctx, role: str, users: commands.Greedy[discord.Member]):
         embed = create_embed(f"{get_emoji('cross')} Hierarchy Error", f"I can't assign **{role_obj.name}** - it's higher than my role!")
         return await ctx.send(embed=embed)
     
-    success_count = 0
-    failed_users = []
-    
-    # Send initial message
-    progress_embed = create_embed(f"{get_emoji('loading')} Processing...", f"Adding **{role_obj.name}** to {len(users)} users...")
-    progress_msg = await ctx.send(embed=progress_embed)
-    
-    for user in users:
-        try:
-            if role_obj not in user.roles:
-                await user.add_roles(role_obj, reason=f"Mass role assignment by {ctx.author}")
-                success_count += 1
-            else:
-                success_count += 1  # Already has role, count as success
-        except discord.Forbidden:
-            failed_users.append(f"{user.name} (No permission)")
-        except discord.HTTPException as e:
-            failed_users.append(f"{user.name} (HTTP Error)")
-        except Exception as e:
-            failed_users.append(f"{user.name} (Unknown error)")
-    
-    # Update with results
-    result_embed = create_embed(
-        f"{get_emoji('tick')} Mass Role Assignment Complete",
-        f"**Successfully added** {role_obj.mention} **to {success_count}/{len(users)} users**"
-    )
-    
-    if failed_users and len(failed_users) <= 10:
-        result_embed.add_field(
-            name="Failed Users",
-            value="\n".join(failed_users[:10]),
-            inline=False
-        )
-    elif failed_users:
-        result_embed.add_field(
-            name="Failed Users",
-            value=f"{len(failed_users)} users failed (too many to display)",
-            inline=False
-        )
-    
-    await progress_msg.edit(embed=result_embed)
+    # Runs as a job, checkpointed so a restart resumes from the last member handled
+    params = {
+        'role_id': role_obj.id,
+        'action': action,
+        'user_ids': [user.id for user in users] if users else None,
+        'has_role_id': flags.has.id if flags.has else None,
+        'joined_after': joined_after,
+        'bots': flags.bots,
+        'reason': f"Mass role {action} by {ctx.author}",
+    }
+    await start_job(ctx, 'massrole', params)
 
 @commands.hybrid_command(name='autorole', description='Add autorole for new members')
 @app_commands.describe(role='Role to auto-assign to new members')
@@ -205,11 +243,6 @@ async def autorole(ctx, *, role: str = None):
     if not role:
         # Show current autoroles
         current_autoroles = ctx.bot.data.get('autoroles', {}).get(guild_id, [])
-        if isinstance(current_autoroles, str):
-            # Convert old single autorole format to list
-            current_autoroles = [current_autoroles]
-            ctx.bot.data.setdefault('autoroles', {})[guild_id] = current_autoroles
-            save_data(ctx.bot.data)
         
         if current_autoroles:
             autorole_list = []
@@ -235,7 +268,7 @@ async def autorole(ctx, *, role: str = None):
         
         if guild_id in ctx.bot.data['autoroles']:
             del ctx.bot.data['autoroles'][guild_id]
-            save_data(ctx.bot.data)
+            save_record(ctx.bot.data, 'autoroles', guild_id)
             embed = create_embed(f"{get_emoji('tick')} All Autoroles Disabled", "All autoroles have been disabled")
         else:
             embed = create_embed(f"{get_emoji('info')} No Autoroles", "No autoroles were set")
@@ -252,9 +285,6 @@ async def autorole(ctx, *, role: str = None):
     
     # Get current autoroles for this guild
     current_autoroles = ctx.bot.data['autoroles'].get(guild_id, [])
-    if isinstance(current_autoroles, str):
-        # Convert old single autorole format to list
-        current_autoroles = [current_autoroles]
     
     # Check if role is already in autoroles
     role_id_str = str(role_obj.id)
@@ -265,7 +295,7 @@ async def autorole(ctx, *, role: str = None):
     # Add new autorole
     current_autoroles.append(role_id_str)
     ctx.bot.data['autoroles'][guild_id] = current_autoroles
-    save_data(ctx.bot.data)
+    save_record(ctx.bot.data, 'autoroles', guild_id)
     
     embed = create_embed(f"{get_emoji('tick')} Autorole Added", f"**{role_obj.name}** added to autoroles!\nNew members will get this role automatically.")
     await ctx.send(embed=embed)
@@ -333,10 +363,6 @@ async def autoroleremove(ctx, *, role: str = None):
         return await ctx.send(embed=embed)
     
     current_autoroles = ctx.bot.data['autoroles'][guild_id]
-    if isinstance(current_autoroles, str):
-        # Convert old single autorole format to list
-        current_autoroles = [current_autoroles]
-        ctx.bot.data['autoroles'][guild_id] = current_autoroles
     
     if not current_autoroles:
         embed = create_embed(f"{get_emoji('info')} No Autoroles", "No autoroles are set in this server")
@@ -384,7 +410,7 @@ async def autoroleremove(ctx, *, role: str = None):
     else:
         ctx.bot.data['autoroles'][guild_id] = current_autoroles
     
-    save_data(ctx.bot.data)
+    save_record(ctx.bot.data, 'autoroles', guild_id)
     
     embed = create_embed(
         f"{get_emoji('tick')} Autorole Removed",
@@ -406,7 +432,7 @@ async def autorolebot(ctx, *, role: str = None):
         # Show current bot autorole
         current_autorole = ctx.bot.data.get('autoroles_bot', {}).get(guild_id)
         if current_autorole:
-            role_obj = ctx.guild.get_role(int(current_autorole))
+            role_obj = ctx.guild.get_role(int(current_autorole[0]))
             if role_obj:
                 embed = create_embed(f"{get_emoji('info')} Current Bot Autorole", f"New bots get: **{role_obj.name}**")
             else:
@@ -422,7 +448,7 @@ async def autorolebot(ctx, *, role: str = None):
         
         if guild_id in ctx.bot.data['autoroles_bot']:
             del ctx.bot.data['autoroles_bot'][guild_id]
-            save_data(ctx.bot.data)
+            save_record(ctx.bot.data, 'autoroles_bot', guild_id)
             embed = create_embed(f"{get_emoji('tick')} Bot Autorole Disabled", "Bot autorole has been disabled")
         else:
             embed = create_embed(f"{get_emoji('info')} No Bot Autorole", "No bot autorole was set")
@@ -437,14 +463,15 @@ async def autorolebot(ctx, *, role: str = None):
     if 'autoroles_bot' not in ctx.bot.data:
         ctx.bot.data['autoroles_bot'] = {}
     
-    ctx.bot.data['autoroles_bot'][guild_id] = str(role_obj.id)
-    save_data(ctx.bot.data)
+    ctx.bot.data['autoroles_bot'][guild_id] = [str(role_obj.id)]
+    save_record(ctx.bot.data, 'autoroles_bot', guild_id)
     
     embed = create_embed(f"{get_emoji('tick')} Bot Autorole Set", f"New bots will get: **{role_obj.name}**")
     await ctx.send(embed=embed)
 
 async def setup(bot):
     """Add role commands to bot"""
+    bot.jobs.register('massrole', run_massrole, 'Mass Role')
     bot.add_command(addrole)
     bot.add_command(removerole)
     bot.add_command(createrole)
@@ -3,6 +3,8 @@ Utility Commands for Discord Bot
 Contains userinfo, serverinfo, avatar, ping, uptime, and other utility commands
 """
 
+import asyncio
+import os
 import discord
 from discord.ext import commands
 from discord import app_commands
@@ -10,13 +12,16 @@ from datetime import datetime
 from utils import get_emoji, create_embed
 from discord.ui import View, Button, button
 
+# Seconds mc/serverinfo wait for a guild's first chunk before answering without counts
+CHUNK_WAIT = float(os.getenv('CHUNK_WAIT', '3'))
+
 @commands.hybrid_command(name="userinfo", description="Show detailed information about a user")
 @app_commands.describe(member="The user you want information about")
 async def userinfo(ctx, member: discord.Member = None):
     member = member or ctx.author
 
-    # Fetch full profile to get banner
-    user = await ctx.bot.fetch_user(member.id)
+    # Full profile (for the banner) from the shared user cache
+    user = await ctx.bot.user_cache.get(member.id) or member
 
     roles = [role.mention for role in member.roles[1:]]  # Exclude @everyone
     roles_display = ", ".join(roles) if roles else "No roles"
@@ -70,36 +75,31 @@ async def userinfo(ctx, member: discord.Member = None):
 
     await ctx.send(embed=embed)
 
+async def member_counts(bot, guild):
+    """(humans, bots) from the maintained counters, waiting briefly for a chunk if needed"""
+    counts = bot.member_counts.get(guild)
+    if counts is None:
+        try:
+            # Shared with any other request for this guild; keeps going in the background on timeout
+            if await asyncio.wait_for(bot.chunker.request(guild), timeout=CHUNK_WAIT):
+                counts = bot.member_counts.get(guild)
+        except asyncio.TimeoutError:
+            return "Counting...", "Counting..."
+    if counts is None:
+        # Chunking failed (lack of permissions, etc.)
+        return "Unavailable", "Unavailable"
+    return counts
+
 @commands.hybrid_command(name="serverinfo", description="Show detailed information about the server")
 async def serverinfo(ctx):
     guild = ctx.guild
 
     total_members = guild.member_count
+    humans, bots = await member_counts(ctx.bot, guild)
     
-    # Try to get accurate member counts
-    try:
-        if not guild.chunked:
-            # Chunk the guild to get accurate member data
-            await guild.chunk(cache=True)
-        
-        # Calculate accurate counts from member cache
-        if guild.chunked:
-            humans = len([m for m in guild.members if not m.bot])
-            bots = total_members - humans
-        else:
-            # Fallback if chunking fails
-            humans = "Unavailable"
-            bots = "Unavailable"
-    except Exception as e:
-        # Handle cases where chunking fails (lack of permissions, etc.)
-        humans = "Unavailable"
-        bots = "Unavailable"
-    
-    # Get banned count properly
+    # Ban count from the bot's ban index (fetched once per guild, then kept current by events)
     try:
-        banned_count = 0
-        async for ban in guild.bans(limit=None):
-            banned_count += 1
+        banned_count = await ctx.bot.ban_index.count(guild)
     except discord.Forbidden:
         banned_count = "No Permission"
     created = f"{guild.created_at:%d %b %Y} (<t:{int(guild.created_at.timestamp())}:R>)"
@@ -277,25 +277,7 @@ async def uptime(ctx):
 async def mc(ctx):
     guild = ctx.guild
     total_members = guild.member_count
-    
-    # Try to get accurate member counts
-    try:
-        if not guild.chunked:
-            # Chunk the guild to get accurate member data
-            await guild.chunk(cache=True)
-        
-        # Calculate accurate counts from member cache
-        if guild.chunked:
-            bots = sum(1 for member in guild.members if member.bot)
-            humans = total_members - bots
-        else:
-            # Fallback if chunking fails
-            humans = "Unavailable"
-            bots = "Unavailable"
-    except Exception as e:
-        # Handle cases where chunking fails (lack of permissions, etc.)
-        humans = "Unavailable"
-        bots = "Unavailable"
+    humans, bots = await member_counts(ctx.bot, guild)
     
     # Online count is unavailable since presences intent is disabled
     online = "Unavailable (presences intent disabled)"
@@ -310,29 +292,28 @@ async def mc(ctx):
     await ctx.send(embed=embed)
 
 @commands.hybrid_command(name='snipe', description='Show last deleted message')
-async def snipe(ctx):
-    if not ctx.bot.deleted_messages:
+@app_commands.describe(index='How far back to look (1 = most recent)')
+async def snipe(ctx, index: int = 1):
+    deleted_msg = ctx.bot.snipes.get(ctx.channel.id, index)
+    if not deleted_msg:
         embed = create_embed(f"{get_emoji('cross')} No Messages", "No recently deleted messages found!")
         return await ctx.send(embed=embed)
     
-    # Get the most recent deleted message
-    deleted_msg = ctx.bot.deleted_messages[-1]
-    
+    content = deleted_msg.content or "*No text content*"
     embed = create_embed(
         "🎯 Message Sniped",
-        f"**Author:** {deleted_msg['author']}\n"
-        f"**Content:** {deleted_msg['content'][:1000]}{'...' if len(deleted_msg['content']) > 1000 else ''}\n"
-        f"**Deleted:** <t:{int(deleted_msg['timestamp'].timestamp())}:R>"
+        f"**Author:** {deleted_msg.author}\n"
+        f"**Content:** {content[:1000]}{'...' if len(content) > 1000 else ''}\n"
+        f"**Deleted:** <t:{int(deleted_msg.deleted_at.timestamp())}:R>"
     )
+    if deleted_msg.attachment:
+        embed.set_image(url=deleted_msg.attachment)
     await ctx.send(embed=embed)
 
 @commands.hybrid_command(name='afk', description='Set AFK status')
 @app_commands.describe(reason='Reason for being AFK')
 async def afk(ctx, *, reason: str = "AFK"):
-    ctx.bot.afk_users[ctx.author.id] = {
-        'reason': reason,
-        'timestamp': datetime.now()
-    }
+    ctx.bot.afk.set(ctx.author.id, reason[:200])
     
     embed = create_embed(
         f"{get_emoji('sleepy')} AFK Set",
@@ -0,0 +1,133 @@
+"""
+Message dispatch for Discord Bot
+Precompiled lookup tables for builtin commands, custom commands and aliases,
+and a one-pass tokenizer shared by every on_message lookup
+"""
+
+from collections import OrderedDict
+
+from discord.ext import commands
+from discord.ext.commands.view import StringView
+
+from storage import MAX_RESIDENT_GUILDS
+
+
+class ParsedMessage:
+    """A message tokenized once: prefix match, lower-cased command word and argument span"""
+    __slots__ = ('content', 'prefixed', 'word', 'args_start')
+
+    def __init__(self, content, prefixed, word, args_start):
+        self.content = content
+        self.prefixed = prefixed
+        self.word = word
+        self.args_start = args_start
+
+    @property
+    def args(self):
+        return self.content[self.args_start:]
+
+
+def parse_message(content, prefix):
+    """Split content into prefix / command word / arguments with a single split()"""
+    body = content.lstrip()
+    prefixed = bool(prefix) and body.startswith(prefix)
+    if prefixed:
+        body = body[len(prefix):]
+        if body[:1].isspace():
+            # "! ban" is not a command, same as discord.py's own parser
+            return ParsedMessage(content, True, '', len(content))
+    parts = body.split(None, 1)
+    word = parts[0].lower() if parts else ''
+    args = parts[1] if len(parts) > 1 else ''
+    return ParsedMessage(content, prefixed, word, len(content) - len(args))
+
+
+def rewrite_alias(parsed, prefix, command):
+    """Return the message re-tokenized with its command word replaced by an alias target"""
+    content = f"{prefix if parsed.prefixed else ''}{command} {parsed.args}".strip()
+    return parse_message(content, prefix)
+
+
+def build_context(bot, message, parsed, prefix):
+    """Build a command Context from a parsed message without get_context() parsing it again"""
+    view = StringView(parsed.content)
+    view.index = view.previous = parsed.args_start
+    return commands.Context(
+        message=message,
+        bot=bot,
+        view=view,
+        prefix=prefix,
+        invoked_with=parsed.word,
+        command=bot.all_commands.get(parsed.word),
+    )
+
+
+class GuildDispatch:
+    """One guild's dispatch tables, rebuilt only after its commands or aliases change"""
+    __slots__ = ('builtins', 'custom', 'aliases')
+
+    def __init__(self, builtins, custom, aliases):
+        self.builtins = builtins
+        self.custom = custom
+        self.aliases = aliases
+
+
+class DispatchIndex:
+    """O(1) lookups for on_message instead of scanning bot.commands per message
+
+    Builtin names and aliases are compiled into one frozenset when commands are
+    added or removed. Each guild's custom commands and aliases are copied into
+    a GuildDispatch on first use and kept until invalidate(guild_id) is called
+    by addcmd/delcmd/addalias/delalias. At most `max_guilds` (the storage
+    backend's resident-guild limit) are kept, least recently used dropped first.
+    """
+
+    def __init__(self, bot, max_guilds=MAX_RESIDENT_GUILDS):
+        self.bot = bot
+        self.max_guilds = max_guilds
+        self._builtins = None
+        self._guilds = OrderedDict()
+        self.builds = 0
+        self.evictions = 0
+
+    @property
+    def builtins(self):
+        if self._builtins is None:
+            names = set()
+            for command in self.bot.commands:
+                names.add(command.name.lower())
+                names.update(alias.lower() for alias in command.aliases)
+            self._builtins = frozenset(names)
+        return self._builtins
+
+    def guild(self, guild_id):
+        """Return the dispatch tables for a guild (guild_id as a string)"""
+        dispatch = self._guilds.get(guild_id)
+        if dispatch is not None:
+            self._guilds.move_to_end(guild_id)
+        else:
+            data = self.bot.data
+            dispatch = GuildDispatch(
+                self.builtins,
+                dict(self.bot.custom_commands.get(guild_id) or {}),
+                dict(data.get('aliases', {}).get(guild_id) or {}),
+            )
+            self._guilds[guild_id] = dispatch
+            self.builds += 1
+            if len(self._guilds) > self.max_guilds:
+                self._guilds.popitem(last=False)
+                self.evictions += 1
+        return dispatch
+
+    def invalidate(self, guild_id):
+        """Drop a guild's tables after its custom commands or aliases changed"""
+        self._guilds.pop(guild_id, None)
+
+    def invalidate_builtins(self):
+        """Recompile builtin names after commands were added or removed"""
+        self._builtins = None
+        self._guilds.clear()
+
+    def stats(self):
+        return {'builtin_names': len(self.builtins), 'cached_guilds': len(self._guilds), 'max_guilds': self.max_guilds,
+                'builds': self.builds, 'evictions': self.evictions}
@@ -2,7 +2,7 @@ import discord
 from discord.ui import View, Button, Modal, TextInput
 from discord import Interaction
 from datetime import datetime
-from utils import replace_placeholders, save_data  # adjust import if needed
+from utils import replace_placeholders, save_record  # adjust import if needed
 
 class EmbedBuilderView(View):
     def __init__(self, bot, ctx, name: str):
@@ -66,12 +66,8 @@ class EmbedBuilderView(View):
             },
             'timestamp': self.timestamp_enabled
         }
-        save_data(self.bot.data)
-                
-        # Force reload data to ensure sync
-        from utils import load_data
-        self.bot.data = load_data()
-        
+        save_record(self.bot.data, 'embeds', guild_id, self.name)
+
         await interaction.response.edit_message(content=f"✅ Embed `{self.name}` saved!", embed=None, view=None)
 
 # -----------------------------
@@ -0,0 +1,367 @@
+"""
+Background jobs for Discord Bot
+Persisted job table and a worker pool that runs long operations (massban, massrole, purge, ...) off the command path
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+
+from bulkops import CancelView, StatusMessage
+from utils import create_embed, get_emoji, json_dumps, json_loads
+
+# Jobs running at once across all guilds, and per guild
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+JOB_PER_GUILD = int(os.getenv('JOB_PER_GUILD', '1'))
+
+# Finished jobs listed by the jobs command
+JOB_HISTORY = 5
+
+JOB_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    message_id INTEGER,
+    author_id INTEGER NOT NULL,
+    params TEXT NOT NULL,
+    cursor INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'queued',
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_guild ON jobs (guild_id, id);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+'''
+
+
+class Job:
+    """One job row plus its runtime handles (cancel event, status message)"""
+    __slots__ = ('id', 'kind', 'guild_id', 'channel_id', 'message_id', 'author_id', 'params',
+                 'cursor', 'done', 'failed', 'state', 'created', 'updated', 'cancelled', 'status', 'store')
+
+    def __init__(self, id, kind, guild_id, channel_id, message_id, author_id, params,
+                 cursor, done, failed, state, created, updated):
+        self.id = id
+        self.kind = kind
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.author_id = author_id
+        self.params = json_loads(params) if isinstance(params, (str, bytes)) else params
+        self.cursor = cursor
+        self.done = done
+        self.failed = failed
+        self.state = state
+        self.created = created
+        self.updated = updated
+        self.cancelled = asyncio.Event()
+        self.status = None
+        self.store = None
+
+    @property
+    def resumed(self):
+        """True when this run picks up after an interrupted one"""
+        return self.cursor > 0 or self.done > 0 or self.failed > 0
+
+    def checkpoint(self, cursor=None, done=None, failed=None):
+        """Persist progress so a restart resumes from here"""
+        if cursor is not None:
+            self.cursor = cursor
+        if done is not None:
+            self.done = done
+        if failed is not None:
+            self.failed = failed
+        self.store.save(self)
+
+    def describe(self):
+        text = f"`#{self.id}` **{self.kind}** - {self.state}"
+        if self.done or self.failed:
+            text += f" ({self.done} done, {self.failed} failed)"
+        return text + f" <t:{int(self.created)}:R>"
+
+
+class JobStore:
+    """The jobs table in kabu.db"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.executescript(JOB_SCHEMA)
+
+    def create(self, kind, guild_id, channel_id, author_id, params, message_id=None):
+        now = time.time()
+        cursor = self.conn.execute(
+            'INSERT INTO jobs (kind, guild_id, channel_id, message_id, author_id, params, created, updated) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (kind, guild_id, channel_id, message_id, author_id, json_dumps(params).decode('utf-8'), now, now))
+        return self.get(cursor.lastrowid)
+
+    def save(self, job):
+        job.updated = time.time()
+        self.conn.execute('UPDATE jobs SET cursor = ?, done = ?, failed = ?, state = ?, updated = ? WHERE id = ?',
+                          (job.cursor, job.done, job.failed, job.state, job.updated, job.id))
+
+    def get(self, job_id):
+        row = self.conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return Job(*row) if row else None
+
+    def active(self):
+        rows = self.conn.execute("SELECT * FROM jobs WHERE state IN ('queued', 'running') ORDER BY id")
+        return [Job(*row) for row in rows]
+
+    def recent(self, guild_id, limit=JOB_HISTORY):
+        rows = self.conn.execute("SELECT * FROM jobs WHERE guild_id = ? AND state NOT IN ('queued', 'running') "
+                                 'ORDER BY id DESC LIMIT ?', (guild_id, limit))
+        return [Job(*row) for row in rows]
+
+    def counts(self):
+        return dict(self.conn.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall())
+
+
+class JobQueue:
+    """Worker pool on the event loop with per-guild fairness
+
+    Queued jobs wait in one deque per guild, and guilds take turns in
+    round-robin order. At most `per_guild` jobs run per guild and `workers`
+    in total, so one guild's backlog of heavy jobs cannot hold every worker.
+    Handlers are registered per kind by the command modules. Jobs still
+    queued or running at shutdown are picked up again at startup, and
+    handlers resume from job.cursor.
+    """
+
+    def __init__(self, bot, store, workers=JOB_WORKERS, per_guild=JOB_PER_GUILD):
+        self.bot = bot
+        self.store = store
+        self.workers = workers
+        self.per_guild = per_guild
+        self._handlers = {}
+        self._uncancellable = set()
+        self._queues = OrderedDict()  # guild_id -> deque of Job, in round-robin order
+        self._running = {}  # job_id -> Job
+        self._running_per_guild = {}
+        self._views = {}  # job_id -> CancelView, until the job ends
+        self._wake = None
+        self._tasks = []
+        self.metrics = {'submitted': 0, 'completed': 0, 'cancelled': 0, 'failed': 0}
+
+    def register(self, kind, handler, title, cancellable=True):
+        """Set the coroutine function run for `kind` jobs; title heads the job's status message
+
+        The handler returns True when it stopped early because job.cancelled
+        was set. Jobs of kinds registered with cancellable=False can only be
+        cancelled while still queued.
+        """
+        self._handlers[kind] = (handler, title)
+        if not cancellable:
+            self._uncancellable.add(kind)
+
+    def title(self, kind):
+        return self._handlers[kind][1]
+
+    def _enqueue(self, job):
+        job.store = self.store
+        self._queues.setdefault(job.guild_id, deque()).append(job)
+        if self._wake is not None:
+            self._wake.set()
+
+    def submit(self, kind, guild_id, channel_id, author_id, params, message_id=None):
+        """Persist and queue a job; returns the Job"""
+        job = self.store.create(kind, guild_id, channel_id, author_id, params, message_id)
+        self.metrics['submitted'] += 1
+        self._enqueue(job)
+        return job
+
+    def position(self, job):
+        """Jobs ahead of this one in its guild's queue"""
+        queue = self._queues.get(job.guild_id, ())
+        return next((index for index, queued in enumerate(queue) if queued.id == job.id), 0)
+
+    def attach_view(self, job, view):
+        """Keep a job's cancel view so it is stopped when the job ends"""
+        view.cancelled = job.cancelled
+        view.on_cancel = lambda interaction: self.cancel_pressed(job.id, interaction)
+        self._views[job.id] = view
+
+    def _dequeue(self, job_id):
+        for queue in self._queues.values():
+            for queued in queue:
+                if queued.id == job_id:
+                    queue.remove(queued)
+                    queued.state = 'cancelled'
+                    self.store.save(queued)
+                    self.metrics['cancelled'] += 1
+                    return queued
+        return None
+
+    def cancel(self, job_id):
+        """Cancel a queued job now, or ask a running one to stop; returns the Job, or None if it can't be"""
+        job = self._running.get(job_id)
+        if job is not None:
+            if job.kind in self._uncancellable:
+                return None
+            job.cancelled.set()
+            return job
+        job = self._dequeue(job_id)
+        if job is not None:
+            asyncio.create_task(self._finish_cancelled(job))
+        return job
+
+    async def cancel_pressed(self, job_id, interaction):
+        """Cancel button of a job: a queued job is closed through the button's interaction
+
+        Returns True when the interaction was answered here. For a running job
+        the view answers it and then sets job.cancelled (they share the event).
+        """
+        job = self._dequeue(job_id)
+        if job is None:
+            return False
+        await self._finish_cancelled(job, interaction)
+        return True
+
+    async def _finish_cancelled(self, job, interaction=None):
+        """Close the status message of a job cancelled before it started"""
+        view = self._views.pop(job.id, None)
+        if view is not None:
+            view.stop()
+        if not job.message_id:
+            return
+        title = self._handlers.get(job.kind, (None, job.kind))[1]
+        embed = create_embed(f"{get_emoji('cross')} {title} Cancelled", f"Job `#{job.id}` was cancelled before it started")
+        try:
+            if interaction is not None:
+                await interaction.response.edit_message(embed=embed, view=None)
+            else:
+                message = self.bot.get_partial_messageable(job.channel_id).get_partial_message(job.message_id)
+                await message.edit(embed=embed, view=None)
+        except Exception:
+            pass
+
+    def guild_jobs(self, guild_id):
+        """Running and queued jobs of a guild, then its most recent finished ones"""
+        running = [job for job in self._running.values() if job.guild_id == guild_id]
+        return running + list(self._queues.get(guild_id, ())), self.store.recent(guild_id)
+
+    def get(self, job_id):
+        job = self._running.get(job_id)
+        if job is not None:
+            return job
+        for queue in self._queues.values():
+            for queued in queue:
+                if queued.id == job_id:
+                    return queued
+        return self.store.get(job_id)
+
+    def _next(self):
+        """Pop the next job in round-robin guild order, skipping guilds at their limit"""
+        for guild_id in list(self._queues):
+            queue = self._queues[guild_id]
+            if not queue:
+                del self._queues[guild_id]
+                continue
+            if self._running_per_guild.get(guild_id, 0) >= self.per_guild:
+                continue
+            self._queues.move_to_end(guild_id)
+            return queue.popleft()
+        return None
+
+    def start(self):
+        """Requeue unfinished jobs and start the workers on the running loop"""
+        if self._tasks:
+            return
+        self._wake = asyncio.Event()
+        queued = {job.id for queue in self._queues.values() for job in queue}
+        pending = [job for job in self.store.active() if job.id not in queued]
+        for job in pending:
+            self._enqueue(job)
+        if pending:
+            print(f"🔁 Requeued {len(pending)} unfinished jobs")
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self):
+        await self.bot.wait_until_ready()
+        while True:
+            job = self._next()
+            if job is None:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            await self._run(job)
+            # A finished job may unblock its guild's next one for another worker
+            self._wake.set()
+
+    async def _run(self, job):
+        handler, title = self._handlers.get(job.kind, (None, job.kind))
+        self._running[job.id] = job
+        self._running_per_guild[job.guild_id] = self._running_per_guild.get(job.guild_id, 0) + 1
+        job.state = 'running'
+        self.store.save(job)
+
+        job.status = StatusMessage(None, f"{get_emoji('tools')} {title}" + (" (resumed)" if job.resumed else ""),
+                                   view=self._views.pop(job.id, None))
+        if job.message_id:
+            channel = self.bot.get_partial_messageable(job.channel_id)
+            job.status.message = channel.get_partial_message(job.message_id)
+        else:
+            job.status.ctx = self.bot.get_partial_messageable(job.channel_id)
+
+        try:
+            if handler is None:
+                raise RuntimeError(f"no handler for {job.kind} jobs")
+            # The handler reports whether it actually stopped early
+            stopped = await handler(self.bot, job)
+            job.state = 'cancelled' if stopped else 'done'
+            self.metrics['cancelled' if stopped else 'completed'] += 1
+        except Exception as e:
+            job.state = 'failed'
+            self.metrics['failed'] += 1
+            print(f"❌ Job {job.id} ({job.kind}) failed: {e}")
+            await job.status.finish(f"{get_emoji('cross')} {title} Failed", f"Job `#{job.id}` stopped: {e}")
+        finally:
+            if job.status.view is not None:
+                job.status.view.stop()
+            self.store.save(job)
+            del self._running[job.id]
+            self._running_per_guild[job.guild_id] -= 1
+
+    async def close(self):
+        """Stop the workers; running jobs stay 'running' and resume at next start"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def stats(self):
+        return dict(
+            self.metrics,
+            running=len(self._running),
+            queued=sum(len(queue) for queue in self._queues.values()),
+            guilds_waiting=len(self._queues),
+        )
+
+
+async def start_job(ctx, kind, params, cancellable=True):
+    """Queue a job from a command: post its status message, then submit it"""
+    jobs = ctx.bot.jobs
+    view = CancelView(ctx.author) if cancellable else None
+    status = StatusMessage(ctx, f"{get_emoji('tools')} {jobs.title(kind)}", view=view)
+    message = await status.start("Queued...")
+    job = jobs.submit(kind, ctx.guild.id if ctx.guild else 0, message.channel.id, ctx.author.id, params, message.id)
+    if view is not None:
+        jobs.attach_view(job, view)
+
+    ahead = jobs.position(job)
+    if ahead:
+        try:
+            await message.edit(embed=create_embed(status.title, f"Job `#{job.id}` queued behind **{ahead}** other job(s) in this server"))
+        except Exception:
+            pass
+    return job
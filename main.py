@@ -14,8 +14,16 @@ from discord.ext import commands, tasks
 import os
 from datetime import datetime
 from utils import (
-    bot_stats, load_data, get_emoji, create_embed, start_web_server, update_bot_stats, build_embed_from_data
+    bot_stats, load_data, get_emoji, create_embed, start_web_server, update_bot_stats, build_embed_from_data,
+    start_storage, close_storage, preload_guild, register_metrics, get_database
 )
+from ratelimit import CommandBudget, CommandRateLimited, Cooldown, MessageRateLimiter, RestBackpressure
+from dispatch import DispatchIndex, build_context, parse_message, rewrite_alias
+from migrations import command_role_id
+from caches import CHUNK_BACKGROUND, BanIndex, ChunkCoordinator, DeletedMessage, MemberCounts, SnipeCache, UserCache
+from scheduler import TimerScheduler
+from stores import AfkRegistry, WarningStore
+from jobs import JobQueue, JobStore
 import asyncio
 import aiohttp
 from dotenv import load_dotenv
@@ -28,6 +36,7 @@ DEFAULT_PREFIX = os.getenv('BOT_PREFIX', '!')
 EMBED_COLOR = discord.Color.blue()
 FOOTER_TEXT = "Made by Nikuuu"
 BOT_OWNER_ID = 957110332495630366  # Owner ID for restricted commands
+AFK_MAX_LISTED = 10  # AFK users listed in one notification
 
 # Dynamic prefix storage (guild_id: prefix)
 guild_prefixes = {}
@@ -52,11 +61,11 @@ ROLE_MAPPINGS = {
 # Dynamic prefix function
 def get_prefix(bot, message):
     if message.guild:
-        return guild_prefixes.get(message.guild.id, DEFAULT_PREFIX)
+        return guild_prefixes.get(str(message.guild.id), DEFAULT_PREFIX)
     return DEFAULT_PREFIX
 
 def get_current_prefix(guild_id):
-    return guild_prefixes.get(guild_id, DEFAULT_PREFIX)
+    return guild_prefixes.get(str(guild_id), DEFAULT_PREFIX)
 
 async def handle_custom_command(message, cmd_name, cmd_data):
     """Handle execution of custom commands for role assignment"""
@@ -70,17 +79,10 @@ async def handle_custom_command(message, cmd_name, cmd_data):
 
     target_user = message.mentions[0]
     
-    # Handle both old and new data structures
-    if isinstance(cmd_data, dict) and 'role_id' in cmd_data:
-        role_id = cmd_data['role_id']
-        role_name = cmd_data.get('role', 'Unknown Role')
-    else:
-        # Legacy support for old structure
-        role_id = cmd_data if isinstance(cmd_data, int) else None
-        role_name = 'Unknown Role'
-
-    # Find the role by ID first
-    role = message.guild.get_role(role_id) if role_id else None
+    # Stored commands are normalized to {'role_id': int, ...} by migrations.py,
+    # except ones with no usable role, which are kept as they were
+    role_id = command_role_id(cmd_data)
+    role = message.guild.get_role(role_id) if role_id is not None else None
     
     if not role:
         embed = create_embed(
@@ -144,6 +146,9 @@ class ModBot(commands.Bot):
         optimized_intents.members = True
         optimized_intents.voice_states = True
         optimized_intents.presences = False  # Disable presences for better performance
+
+        # Command lookup tables, kept current by add_command/remove_command
+        self.dispatch_index = DispatchIndex(self)
         
         super().__init__(
             command_prefix=get_prefix,
@@ -165,38 +170,46 @@ class ModBot(commands.Bot):
         self.no_prefix_users = set(self.data.get('no_prefix_users', []))
         self.custom_commands = self.data.get('custom_commands', {})
         
-        # Load guild prefixes
+        # Load guild prefixes (keyed by guild ID string, shared with setprefix)
         global guild_prefixes
-        guild_prefixes = self.data.get('guild_prefixes', {})
-
-        # Ensure data persistence
-        self.force_save_data()
-        
-    def force_save_data(self):
-        """Force save all current data to ensure persistence"""
-        try:
-            from utils import save_data
-            save_data(self.data)
-            print("💾 Force saved all bot data on startup")
-        except Exception as e:
-            print(f"❌ Error force saving data: {e}")
+        guild_prefixes = self.data.setdefault('guild_prefixes', {})
         
         # Music system variables
         self.music_queues = {}
         self.bot_voice_clients = {}
         
         # AFK system
-        self.afk_users = {}
+        self.afk = AfkRegistry(get_database())
+        register_metrics('afk', self.afk.stats)
+
+        # Background jobs (massban, massrole, purge, cbot, backup); handlers are registered by command modules
+        self.jobs = JobQueue(self, JobStore(get_database()))
+        register_metrics('jobs', self.jobs.stats)
         
         # Statistics
         self.start_time = datetime.now()
         self.commands_used = 0
         
-        # Snipe system
-        self.deleted_messages = []
+        # Snipe system: bounded per-channel ring buffers fed by on_raw_message_delete
+        self.snipes = SnipeCache()
+        register_metrics('snipes', self.snipes.stats)
+
+        # Ban lists fetched once per guild, then kept current by on_member_ban/on_member_unban
+        self.ban_index = BanIndex()
+        register_metrics('ban_index', self.ban_index.stats)
+
+        # Full user profiles (fetch_user) shared across commands, with a TTL and coalesced fetches
+        self.user_cache = UserCache(self)
+        register_metrics('user_cache', self.user_cache.stats)
+
+        # Guilds aren't chunked at startup; chunking is requested through one deduplicated, prioritized queue
+        self.member_counts = MemberCounts()
+        self.chunker = ChunkCoordinator(self, self.member_counts)
+        register_metrics('chunking', lambda: dict(self.chunker.stats(), counted_guilds=self.member_counts.stats()['guilds']))
         
-        # Warning system
-        self.user_warnings = {}
+        # Warning system: persistent log with per-member counts (kabu.db)
+        self.warnings = WarningStore(get_database())
+        register_metrics('warnings', self.warnings.stats)
         
         # Commands synced flag
         self.commands_synced = False
@@ -208,6 +221,38 @@ class ModBot(commands.Bot):
         self.latency_samples = []
         self.commands_used = 0
 
+        # Per-user/channel/guild message rate limits (RATELIMIT_USER etc.)
+        self.message_limiter = MessageRateLimiter()
+        register_metrics('ratelimit', self.message_limiter.stats)
+
+        # Slows or sheds message handling only when our REST rate nears Discord's limit
+        self.backpressure = RestBackpressure()
+        self.backpressure.install(self.http)
+        register_metrics('backpressure', self.backpressure.stats)
+        register_metrics('dispatch', self.dispatch_index.stats)
+
+        # Bounded, self-expiring cooldown stores
+        self.mention_cooldowns = Cooldown(30)  # One bot-mention reply per user every 30s
+        register_metrics('cooldowns', lambda: {'mentions': self.mention_cooldowns.stats()})
+
+        # Weighted per-user command budget, enforced before the command body runs
+        self.command_budget = CommandBudget()
+        self.add_check(self.command_budget.check, call_once=True)
+        register_metrics('command_budget', self.command_budget.stats)
+
+        # Persistent one-shot timers (reminders); handlers are registered by command modules
+        self.scheduler = TimerScheduler(get_database())
+        register_metrics('scheduler', self.scheduler.stats)
+
+    def add_command(self, command, /):
+        super().add_command(command)
+        self.dispatch_index.invalidate_builtins()
+
+    def remove_command(self, name, /):
+        command = super().remove_command(name)
+        self.dispatch_index.invalidate_builtins()
+        return command
+
     @tasks.loop(minutes=1)
     async def performance_monitor(self):
         """Monitor bot performance and latency"""
@@ -234,6 +279,18 @@ class ModBot(commands.Bot):
     async def before_performance_monitor(self):
         await self.wait_until_ready()
 
+    @tasks.loop(minutes=30)
+    async def reconcile_bans(self):
+        """Re-fetch stale ban lists so missed events can't leave counts wrong for long"""
+        try:
+            await self.ban_index.reconcile(self)
+        except Exception as e:
+            print(f"❌ Ban reconcile error: {e}")
+
+    @reconcile_bans.before_loop
+    async def before_reconcile_bans(self):
+        await self.wait_until_ready()
+
     async def setup_hook(self):
         """Setup function called when bot is starting"""
         # Start web server immediately to satisfy deployment health checks
@@ -267,12 +324,21 @@ class ModBot(commands.Bot):
         # Search command disabled - removed due to YouTube authentication issues
         # await self.load_extension("search")
         
+        # Start background persistence so queued saves get written
+        start_storage()
+
         # Start performance monitoring
         self.performance_monitor.start()
+        self.reconcile_bans.start()
+        self.chunker.start()
         
         # Load all organized command modules
         from commands import setup_all_commands
         await setup_all_commands(self)
+
+        # Timer handlers are registered by the modules above, so overdue timers can fire now
+        self.scheduler.start(self.wait_until_ready)
+        self.jobs.start()
         
         if not self.commands_synced:
             try:
@@ -288,6 +354,10 @@ class ModBot(commands.Bot):
         print(f"🤖 Bot is ready! Logged in as {self.user}")
         print(f"📊 Connected to {len(self.guilds)} guilds with {len(set(self.get_all_members()))} users")
         
+        # Guilds are chunked on demand; CHUNK_BACKGROUND=1 also fills them gradually after startup
+        if CHUNK_BACKGROUND:
+            self.chunker.prefetch(self.guilds)
+        
         # Set bot presence
         await self.change_presence(
             activity=discord.Activity(
@@ -328,80 +398,68 @@ class ModBot(commands.Bot):
     async def before_update_stats(self):
         await self.wait_until_ready()
 
+    async def notify_afk(self, message):
+        """Welcome back an AFK author and list every AFK user mentioned, in one embed"""
+        returned = self.afk.pop(message.author.id)
+        mentioned = self.afk.lookup(
+            user.id for user in message.mentions if user.id != message.author.id
+        ) if message.mentions else {}
+        if returned is None and not mentioned:
+            return
+
+        lines = []
+        for user in message.mentions:
+            if user.id in mentioned:
+                reason, since = mentioned.pop(user.id)
+                lines.append(f"*{user.display_name}* - {reason} (<t:{int(since)}:R>)")
+        if len(lines) > AFK_MAX_LISTED:
+            lines = lines[:AFK_MAX_LISTED] + [f"...and {len(lines) - AFK_MAX_LISTED} more"]
+
+        if returned is not None:
+            embed = create_embed(
+                f"{get_emoji('tick')} Welcome back!",
+                f"*{message.author.display_name}* is no longer AFK\n"
+                f"You were AFK for: *{returned[0]}*"
+            )
+            if lines:
+                embed.add_field(name=f"{get_emoji('sleepy')} AFK", value="\n".join(lines)[:1024], inline=False)
+        else:
+            title = "User is AFK" if len(lines) == 1 else "Users are AFK"
+            embed = create_embed(f"{get_emoji('sleepy')} {title}", "\n".join(lines))
+
+        try:
+            await message.channel.send(embed=embed, delete_after=15 if lines else 10)
+        except discord.HTTPException:
+            pass  # Ignore rate limit errors for AFK messages
+
     async def on_message(self, message):
         """Optimized message handling with strict rate limiting"""
         if message.author.bot:
             return
 
-        # Much stricter rate limiting - prevent API spam
-        if not hasattr(self, 'message_timestamps'):
-            self.message_timestamps = []
-        
-        current_time = datetime.now().timestamp()
-        
-        # Clean old timestamps (last 60 seconds)
-        self.message_timestamps = [t for t in self.message_timestamps if current_time - t < 60]
-        
-        # Limit to 15 messages per minute to prevent rate limiting
-        if len(self.message_timestamps) >= 15:
+        # Token buckets per user, channel and guild; rejections show up in /api/metrics
+        if self.message_limiter.check(message):
             return
         
-        self.message_timestamps.append(current_time)
-        
-        # Add delay between processing messages
-        await asyncio.sleep(0.2)
+        # No fixed delay: only wait (or drop) when outbound REST traffic is near the limit
+        if not await self.backpressure.admit():
+            return
 
-        # Handle AFK system (optimized with rate limiting)
-        if message.author.id in self.afk_users:
-            afk_data = self.afk_users[message.author.id]
-            del self.afk_users[message.author.id]
+        # Lazily-loaded guilds are read on the storage thread, not on first access below
+        if message.guild:
+            await preload_guild(message.guild.id)
 
-            embed = create_embed(
-                f"{get_emoji('tick')} Welcome back!",
-                f"*{message.author.display_name}* is no longer AFK\n"
-                f"You were AFK for: *{afk_data['reason']}*"
-            )
-            # Use create_task for non-blocking execution with rate limiting
-            try:
-                asyncio.create_task(message.channel.send(embed=embed, delete_after=10))
-            except discord.HTTPException:
-                pass  # Ignore rate limit errors for AFK messages
-
-        # Notify if mentioned user is AFK (limit to first mention only)
-        if message.mentions and len(message.mentions) > 0:
-            mention = message.mentions[0]  # Only check first mention
-            if mention.id in self.afk_users:
-                afk_data = self.afk_users[mention.id]
-                time_afk = datetime.now() - afk_data['timestamp']
-                hours, remainder = divmod(int(time_afk.total_seconds()), 3600)
-                minutes, _ = divmod(remainder, 60)
-
-                embed = create_embed(
-                    f"{get_emoji('sleepy')} User is AFK",
-                    f"*{mention.display_name}* is currently AFK\n"
-                    f"*Reason:* {afk_data['reason']}\n"
-                    f"*Time:* {hours}h {minutes}m ago"
-                )
-                try:
-                    await message.channel.send(embed=embed, delete_after=15)
-                except discord.HTTPException:
-                    pass  # Ignore rate limit errors
+        # AFK system: one set intersection for the author and every mention,
+        # and at most one coalesced notification per message
+        if self.afk:
+            await self.notify_afk(message)
 
         # Respond if someone mentions the bot directly (with cooldown)
         if self.user in message.mentions and not message.mention_everyone:
             if len(message.content.split()) == 1:
                 # Add cooldown to prevent spam
-                if not hasattr(self, 'mention_cooldowns'):
-                    self.mention_cooldowns = {}
-                
-                user_id = message.author.id
-                current_time = datetime.now().timestamp()
-                
-                if user_id in self.mention_cooldowns:
-                    if current_time - self.mention_cooldowns[user_id] < 30:  # 30 second cooldown
-                        return
-                
-                self.mention_cooldowns[user_id] = current_time
+                if not self.mention_cooldowns.hit(message.author.id):
+                    return
                 
                 embed = create_embed(
                     "<:Bots:1407904145393844318> Hello there!",
@@ -417,56 +475,34 @@ class ModBot(commands.Bot):
         # Process in guild only
         if message.guild:
             prefix = get_current_prefix(message.guild.id)
-            content = message.content.strip()
-
-            # Alias map
-            alias_map = self.data.get('aliases', {}).get(str(message.guild.id), {})
-
-            parts = content.split()
-            if parts:
-                cmd_name = parts[0].lower()
-
-                # Replace alias if prefix command
-                if content.startswith(prefix):
-                    real_cmd = alias_map.get(cmd_name)
-                    if real_cmd:
-                        message.content = f"{prefix}{real_cmd} {' '.join(parts[1:])}".strip()
-                            
-                # Replace alias if no-prefix user
-                elif message.author.id in self.no_prefix_users:
-                    real_cmd = alias_map.get(cmd_name)
-                    if real_cmd:
-                        message.content = f"{real_cmd} {' '.join(parts[1:])}".strip()
-
-            # After alias replacement, continue normal processing
-            guild_id = str(message.guild.id)
 
-            # Check custom commands
-            cmd_name = message.content[len(prefix):].split()[0].lower() if message.content.startswith(prefix) else ""
-            if guild_id in self.custom_commands and cmd_name in self.custom_commands[guild_id]:
-                await handle_custom_command(message, cmd_name, self.custom_commands[guild_id][cmd_name])
-                return
+            # Precompiled custom commands and aliases for this guild
+            dispatch = self.dispatch_index.guild(str(message.guild.id))
 
-            # No-prefix built-in commands
-            if message.author.id in self.no_prefix_users:
-                all_commands = []
-                for command in self.commands:
-                    all_commands.append(command.name)
-                    all_commands.extend(command.aliases)
+            # Tokenize once; alias resolution and every lookup below share the result
+            parsed = parse_message(message.content, prefix)
+            no_prefix = not parsed.prefixed and message.author.id in self.no_prefix_users
+            if not parsed.word or not (parsed.prefixed or no_prefix):
+                return
 
-                custom_commands = list(self.custom_commands.get(guild_id, {}).keys())
-                first_word = message.content.split()[0].lower() if message.content.split() else ""
+            # Replace alias for prefix commands and no-prefix users
+            real_cmd = dispatch.aliases.get(parsed.word)
+            if real_cmd:
+                parsed = rewrite_alias(parsed, prefix, real_cmd)
+                message.content = parsed.content
 
-                if first_word in custom_commands:
-                    await handle_custom_command(message, first_word, self.custom_commands[guild_id][first_word])
-                    return
+            # Check custom commands
+            if parsed.word in dispatch.custom:
+                await handle_custom_command(message, parsed.word, dispatch.custom[parsed.word])
+                return
 
-                if first_word in all_commands:
-                    message.content = f"{prefix}{message.content}"
-                    ctx = await self.get_context(message)
-                    if ctx.valid:
-                        self.commands_used += 1
-                        return await self.invoke(ctx)
+            # Built-in commands (no-prefix users only reach here for known names)
+            if parsed.prefixed or parsed.word in dispatch.builtins:
+                ctx = build_context(self, message, parsed, prefix)
+                if ctx.valid:
+                    self.commands_used += 1
+                    await self.invoke(ctx)
+            return
 
         # Finally process as normal command
         ctx = await self.get_context(message)
@@ -478,82 +514,62 @@ class ModBot(commands.Bot):
         """Clean up resources when bot shuts down"""
         if self.session:
             await self.session.close()
+        await self.scheduler.close()
+        await self.jobs.close()
+        await self.chunker.close()
+        # Force a final flush so no queued changes are lost
+        await close_storage()
         await super().close()
 
     async def on_command(self, ctx):
         """Called when a command is invoked"""
         self.commands_used += 1
-        
-        # Add command rate limiting per user
-        if not hasattr(self, 'command_cooldowns'):
-            self.command_cooldowns = {}
-        
-        user_id = ctx.author.id
-        current_time = datetime.now().timestamp()
-        
-        if user_id in self.command_cooldowns:
-            # Remove old entries
-            self.command_cooldowns[user_id] = [
-                t for t in self.command_cooldowns[user_id] 
-                if current_time - t < 60  # 1 minute window
-            ]
-            
-            # Check if user is sending too many commands
-            if len(self.command_cooldowns[user_id]) > 10:  # Max 10 commands per minute
-                embed = create_embed(
-                    f"{get_emoji('cross')} Rate Limited",
-                    "You're sending commands too quickly! Please wait a moment."
-                )
-                try:
-                    await ctx.send(embed=embed, delete_after=10)
-                except:
-                    pass
-                return
-            
-            self.command_cooldowns[user_id].append(current_time)
-        else:
-            self.command_cooldowns[user_id] = [current_time]
-        
         print(f"🔧 Command '{ctx.command}' used by {ctx.author} in {ctx.guild}")
         
+    async def on_raw_message_delete(self, payload):
+        """Record deleted messages for snipe; fires for cached and uncached messages alike"""
+        message = payload.cached_message
+        if message is None:
+            # Discord doesn't resend content, so only messages still in the cache can be sniped
+            self.snipes.uncached += 1
+            return
+        if message.author.bot or not (message.content or message.attachments):
+            return
+        self.snipes.add(payload.channel_id, DeletedMessage.from_message(message))
+
+    async def on_member_remove(self, member):
+        self.member_counts.on_remove(member)
+
+    async def on_guild_join(self, guild):
+        if CHUNK_BACKGROUND:
+            self.chunker.prefetch([guild])
+
+    async def on_guild_remove(self, guild):
+        self.member_counts.forget(guild.id)
+
+    async def on_member_ban(self, guild, user):
+        self.ban_index.on_ban(guild.id, user.id)
+
+    async def on_member_unban(self, guild, user):
+        self.ban_index.on_unban(guild.id, user.id)
+
     async def on_member_join(self, member):
+        self.member_counts.on_join(member)
         guild_id = str(member.guild.id)
         
         # Determine which autorole to use based on member type
         autorole_key = 'autoroles_bot' if member.bot else 'autoroles'
         member_type = "bot" if member.bot else "human"
         
-        # Handle autorole with enhanced error checking
-        if autorole_key in self.data and guild_id in self.data[autorole_key]:
+        # Autoroles are stored as lists of role ID strings (see migrations.py)
+        role_ids = self.data.get(autorole_key, {}).get(guild_id)
+        if role_ids:
             try:
-                role_data = self.data[autorole_key][guild_id]
-                
-                # Handle both old single role format and new multiple roles format
-                role_ids = []
-                if isinstance(role_data, str):
-                    try:
-                        role_ids = [int(role_data)]
-                    except ValueError:
-                        print(f"❌ Invalid role ID string: {role_data}")
-                        return
-                elif isinstance(role_data, list):
-                    for role_id in role_data:
-                        try:
-                            role_ids.append(int(role_id))
-                        except ValueError:
-                            print(f"❌ Invalid role ID in list: {role_id}")
-                else:
-                    try:
-                        role_ids = [int(role_data)]  # Direct integer
-                    except (ValueError, TypeError):
-                        print(f"❌ Invalid role data type: {type(role_data)} - {role_data}")
-                        return
-                
                 roles_assigned = 0
                 total_roles = len(role_ids)
                 
                 for role_id in role_ids:
-                    role = member.guild.get_role(role_id)
+                    role = member.guild.get_role(int(role_id))
                     
                     if role:
                         # Check if bot has permission to assign the role
@@ -579,8 +595,6 @@ class ModBot(commands.Bot):
                 if roles_assigned > 0:
                     print(f"✅ Successfully assigned {roles_assigned}/{total_roles} {member_type} autoroles to {member.display_name}")
                     
-            except ValueError as e:
-                print(f"❌ Invalid {member_type} autorole ID for {member.guild.name}: {self.data[autorole_key][guild_id]} - {e}")
             except Exception as e:
                 print(f"❌ Unexpected error with {member_type} autorole for {member.display_name}: {e}")
         
@@ -650,8 +664,9 @@ class ModBot(commands.Bot):
                     guild_id = str(ctx.guild.id)
                     cmd_name = ctx.message.content.split()[0][len(ctx.prefix):].lower()
                     
-                    if guild_id in self.custom_commands and cmd_name in self.custom_commands[guild_id]:
-                        await handle_custom_command(ctx.message, cmd_name, self.custom_commands[guild_id][cmd_name])
+                    custom = self.dispatch_index.guild(guild_id).custom
+                    if cmd_name in custom:
+                        await handle_custom_command(ctx.message, cmd_name, custom[cmd_name])
                         return
                 return
             
@@ -667,6 +682,13 @@ class ModBot(commands.Bot):
                     print(f"❌ HTTP Error {error.status}: {error}")
                     return
             
+            elif isinstance(error, CommandRateLimited):
+                embed = create_embed(
+                    f"{get_emoji('cross')} Rate Limited",
+                    f"You're sending commands too quickly! Try again in {error.retry_after:.0f}s."
+                )
+                await ctx.send(embed=embed, delete_after=10)
+            
             elif isinstance(error, commands.MissingPermissions):
                 embed = create_embed(
                     f"{get_emoji('cross')} Missing Permissions",
@@ -751,6 +773,8 @@ class HelpSelect(Select):
                 "• Slowmode — Set slowmode\n"
                 "• Nuke — Delete & recreate channel\n"
                 "• Massban — Ban multiple users\n"
+                "• Jobs — Show background jobs\n"
+                "• Jobcancel — Cancel a background job\n"
                 "• Leaveguild — Bot leaves server\n"
                 "• Setprefix — change prefix"
             )
@@ -828,9 +852,6 @@ class HelpSelect(Select):
         embed.set_footer(text="Designed & crafted by Onevibe 🫧")
         await interaction.response.edit_message(embed=embed, view=self.view)
 
-# Create optimized bot instance
-bot = ModBot()
-
 # Performance optimizations added to existing bot structure
 
 # Help Command
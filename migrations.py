@@ -0,0 +1,145 @@
+"""
+Schema migrations for stored bot data
+Each migration rewrites one per-guild section into its canonical shape, so the
+event handlers can rely on a single format instead of checking types per event
+
+Usage: python migrations.py [--dry-run] [data.json]
+"""
+
+import sys
+
+# Bumped whenever a migration is added; stored in bot.data['schema_version']
+SCHEMA_VERSION = 2
+
+
+def _role_id_list(value):
+    """Autoroles: a single ID (str or int) or a list of IDs -> list of ID strings"""
+    values = value if isinstance(value, list) else [value]
+    role_ids = []
+    for role_id in values:
+        role_id = str(role_id).strip()
+        if role_id.isdigit() and role_id not in role_ids:
+            role_ids.append(role_id)
+    return role_ids
+
+
+def command_role_id(cmd_data):
+    """The int role ID of a stored custom command (any stored shape), or None if it has no usable role"""
+    role_id = cmd_data.get('role_id') if isinstance(cmd_data, dict) else cmd_data
+    if isinstance(role_id, str) and role_id.strip().isdigit():
+        role_id = int(role_id)
+    if not isinstance(role_id, int) or isinstance(role_id, bool):
+        return None
+    return role_id
+
+
+def _command_dicts(commands):
+    """Custom commands: bare role IDs and old dicts -> {'role_id': int, 'role_name': str, ...}
+
+    Commands without a usable role are kept unchanged (see unusable_commands).
+    """
+    if not isinstance(commands, dict):
+        return commands
+    migrated = {}
+    for name, cmd_data in commands.items():
+        role_id = command_role_id(cmd_data)
+        if role_id is None:
+            migrated[name] = cmd_data
+            continue
+        cmd_data = dict(cmd_data) if isinstance(cmd_data, dict) else {}
+        cmd_data['role_id'] = role_id
+        cmd_data.setdefault('role_name', cmd_data.get('role', 'Unknown Role'))
+        migrated[name] = cmd_data
+    return migrated
+
+
+# (version, section, description, function) - functions must be idempotent because
+# lazily-loading backends apply them every time a guild is loaded
+MIGRATIONS = [
+    (1, 'autoroles', "Store member autoroles as a list of role ID strings", _role_id_list),
+    (1, 'autoroles_bot', "Store bot autoroles as a list of role ID strings", _role_id_list),
+    (2, 'custom_commands', "Store every custom command as a dict with an int role_id", _command_dicts),
+]
+
+
+def migrate_shard(shard, since=0):
+    """Migrate one guild's {section: value} in place; returns the sections that changed"""
+    changed = []
+    for version, section, description, migrate in MIGRATIONS:
+        if version <= since or section not in shard:
+            continue
+        value = migrate(shard[section])
+        if value != shard[section]:
+            shard[section] = value
+            changed.append(section)
+    return changed
+
+
+def migrate_data(data, dry_run=False):
+    """Bring bot.data up to SCHEMA_VERSION
+
+    Returns a list of (version, description, section, guild_id, old, new) for
+    every record that changed. With dry_run the data is left untouched.
+    """
+    current = data.get('schema_version', 0)
+    changes = []
+    for version, section, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        section_data = data.get(section) or {}
+        for guild_id, value in list(section_data.items()):
+            new_value = migrate(value)
+            if new_value == value:
+                continue
+            changes.append((version, description, section, guild_id, value, new_value))
+            if not dry_run:
+                section_data[guild_id] = new_value
+    if not dry_run and current < SCHEMA_VERSION:
+        data['schema_version'] = SCHEMA_VERSION
+    return changes
+
+
+def unusable_commands(data):
+    """Return (guild_id, name, value) for stored custom commands that have no usable role"""
+    found = []
+    for guild_id, commands in (data.get('custom_commands') or {}).items():
+        if not isinstance(commands, dict):
+            found.append((guild_id, None, commands))
+            continue
+        for name, cmd_data in commands.items():
+            if command_role_id(cmd_data) is None:
+                found.append((guild_id, name, cmd_data))
+    return found
+
+
+def format_report(changes, current=0):
+    """Summarise migration changes, one block per migration"""
+    lines = [f"Schema version {current} -> {SCHEMA_VERSION}"]
+    for version, section, description, _ in MIGRATIONS:
+        if version <= current:
+            continue
+        records = [change for change in changes if change[2] == section]
+        lines.append(f"v{version} {section}: {description} - {len(records)} record(s)")
+        for _, _, _, guild_id, old, new in records:
+            lines.append(f"    guild {guild_id}: {old!r} -> {new!r}")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    from storage import JsonStorage, DATA_FILE
+
+    args = [arg for arg in sys.argv[1:] if arg != '--dry-run']
+    dry_run = '--dry-run' in sys.argv[1:]
+    backend = JsonStorage(args[0] if args else DATA_FILE)
+    data = backend.load()
+    current = data.get('schema_version', 0)
+    changes = migrate_data(data, dry_run=dry_run)
+    print(format_report(changes, current))
+    unusable = unusable_commands(data)
+    if unusable:
+        print(f"⚠️ {len(unusable)} custom command(s) have no usable role and were left as they are:")
+        for guild_id, name, value in unusable:
+            print(f"    guild {guild_id}: {name or '(whole section)'} = {value!r}")
+    if not dry_run:
+        backend.write(data)
+        print(f"💾 Wrote migrated data to {backend.path}")
@@ -0,0 +1,322 @@
+"""
+Rate limiting for Discord Bot
+Token buckets keyed per user, channel and guild for incoming messages, and
+backpressure driven by the bot's own outbound REST request rate
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+import discord
+from discord.ext import commands
+
+# Discord's global REST limit for a bot, in requests per second
+REST_RATE_LIMIT = float(os.getenv('REST_RATE_LIMIT', '50'))
+
+# Budget a command takes from its user's command limit; unlisted commands cost 1
+COMMAND_COSTS = {
+    'massban': 5,
+    'massrole': 5,
+    'nuke': 5,
+    'cbot': 3,
+    'purge': 3,
+    'backup': 3,
+    'serverinfo': 2,
+    'userinfo': 2,
+}
+
+
+def parse_policy(value, default):
+    """Parse a "count/seconds" policy string, e.g. "10/10" -> (10, 10.0)"""
+    try:
+        count, seconds = (value or default).split('/')
+        return int(count), float(seconds)
+    except ValueError:
+        print(f"❌ Invalid rate limit policy {value!r}, using {default}")
+        count, seconds = default.split('/')
+        return int(count), float(seconds)
+
+
+class ExpiringStore:
+    """Map whose entries expire `ttl` seconds after they were last set
+
+    Every entry shares one TTL and set() moves a key to the end, so the oldest
+    entry always expires first and pruning only ever looks at the front:
+    amortized O(1) per call. `max_keys` caps memory by evicting the oldest.
+    """
+
+    def __init__(self, ttl, max_keys=50000):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._entries = OrderedDict()  # key -> (last_set, value)
+        self.expired = 0
+        self.evicted = 0
+
+    def _prune(self, now):
+        entries = self._entries
+        while entries:
+            key, (last_set, _) = next(iter(entries.items()))
+            if now - last_set < self.ttl:
+                break
+            entries.popitem(last=False)
+            self.expired += 1
+
+    def get(self, key, now=None):
+        """Return the live value for key, or None if missing or expired"""
+        self._prune(now or time.monotonic())
+        entry = self._entries.get(key)
+        return entry[1] if entry else None
+
+    def entry(self, key):
+        """Return (last_set, value) for key without pruning, or None"""
+        return self._entries.get(key)
+
+    def set(self, key, value, now=None):
+        now = now or time.monotonic()
+        self._prune(now)
+        self._entries[key] = (now, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {'size': len(self._entries), 'max_keys': self.max_keys, 'ttl': self.ttl,
+                'expired': self.expired, 'evicted': self.evicted}
+
+
+class Cooldown:
+    """Per-key cooldown: hit() succeeds at most once every `seconds`"""
+
+    def __init__(self, seconds, max_keys=50000):
+        self.store = ExpiringStore(seconds, max_keys)
+        self.rejected = 0
+
+    def hit(self, key):
+        if self.store.get(key) is not None:
+            self.rejected += 1
+            return False
+        self.store.set(key, True)
+        return True
+
+    def stats(self):
+        return dict(self.store.stats(), rejected=self.rejected)
+
+
+class TokenBucketLimiter:
+    """One token bucket per key, refilled lazily from the time since its last use
+
+    A bucket holds up to `capacity` tokens and regains `capacity / per` tokens a
+    second, so each check is O(1) no matter how many messages came before.
+    """
+
+    def __init__(self, name, capacity, per, max_keys=50000):
+        self.name = name
+        self.capacity = float(capacity)
+        self.fill_rate = capacity / per
+        # A bucket left alone for `per` seconds is full again and needs no state
+        self._buckets = ExpiringStore(per, max_keys)  # key -> tokens left at last take
+        self.allowed = 0
+        self.rejected = 0
+
+    def _refilled(self, key, now):
+        entry = self._buckets.entry(key)
+        if entry is None:
+            return self.capacity
+        last_take, tokens = entry
+        return min(self.capacity, tokens + (now - last_take) * self.fill_rate)
+
+    def peek(self, key, cost=1, now=None):
+        """True if `cost` tokens are available, without taking them"""
+        return self._refilled(key, now or time.monotonic()) >= cost
+
+    def take(self, key, cost=1, now=None):
+        """Take `cost` tokens (may go negative when forced after a peek)"""
+        now = now or time.monotonic()
+        self._buckets.set(key, self._refilled(key, now) - cost, now)
+        self.allowed += 1
+
+    def retry_after(self, key, cost=1):
+        """Seconds until `cost` tokens will be available for key"""
+        missing = cost - self._refilled(key, time.monotonic())
+        return max(missing, 0) / self.fill_rate
+
+    def hit(self, key, cost=1, now=None):
+        """Take `cost` tokens if available; returns False when rate limited"""
+        now = now or time.monotonic()
+        if not self.peek(key, cost, now):
+            self.rejected += 1
+            return False
+        self.take(key, cost, now)
+        return True
+
+    def stats(self):
+        return {
+            'capacity': self.capacity,
+            'per_second': round(self.fill_rate, 3),
+            'tracked_keys': len(self._buckets),
+            'allowed': self.allowed,
+            'rejected': self.rejected,
+        }
+
+
+class CommandRateLimited(commands.CheckFailure):
+    """Raised by the command budget check; handled in on_command_error"""
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"Command rate limit hit, retry in {retry_after:.0f}s")
+
+
+class CommandBudget:
+    """Per-user command budget, checked before a command body runs
+
+    Installed as a call-once bot check, so prefix, no-prefix and slash
+    invocations are all rejected before they reach the command. Heavier
+    commands take more of the budget (COMMAND_COSTS).
+    """
+
+    def __init__(self, policy=None, costs=None):
+        capacity, per = policy or parse_policy(os.getenv('RATELIMIT_COMMANDS'), '10/60')
+        self.buckets = TokenBucketLimiter('commands', capacity, per)
+        self.costs = costs if costs is not None else COMMAND_COSTS
+
+    def cost(self, command):
+        # Never more than a full bucket, or the command could never run
+        name = command.root_parent.name if command.root_parent else command.name
+        return min(self.costs.get(name, 1), self.buckets.capacity)
+
+    async def check(self, ctx):
+        if ctx.command is None:
+            return True
+        cost = self.cost(ctx.command)
+        if not self.buckets.hit(ctx.author.id, cost):
+            raise CommandRateLimited(self.buckets.retry_after(ctx.author.id, cost))
+        return True
+
+    def stats(self):
+        return dict(self.buckets.stats(), costs=self.costs)
+
+
+class MessageRateLimiter:
+    """Checks a message against the user, channel and guild buckets together
+
+    Tokens are only taken when every scope has room, so a spammer who hits
+    their own limit does not also drain the channel and guild buckets.
+    """
+
+    SCOPES = ('user', 'channel', 'guild')
+
+    def __init__(self, policies=None):
+        policies = policies or {
+            'user': parse_policy(os.getenv('RATELIMIT_USER'), '10/10'),
+            'channel': parse_policy(os.getenv('RATELIMIT_CHANNEL'), '30/10'),
+            'guild': parse_policy(os.getenv('RATELIMIT_GUILD'), '120/10'),
+        }
+        self.limiters = {scope: TokenBucketLimiter(scope, *policies[scope]) for scope in self.SCOPES}
+
+    def _keys(self, message):
+        return {
+            'user': message.author.id,
+            'channel': message.channel.id,
+            'guild': message.guild.id if message.guild else None,
+        }
+
+    def check(self, message, cost=1):
+        """Return None if allowed, or the name of the scope that rejected the message"""
+        now = time.monotonic()
+        keys = self._keys(message)
+        for scope in self.SCOPES:
+            if keys[scope] is not None and not self.limiters[scope].peek(keys[scope], cost, now):
+                self.limiters[scope].rejected += 1
+                return scope
+        for scope in self.SCOPES:
+            if keys[scope] is not None:
+                self.limiters[scope].take(keys[scope], cost, now)
+        return None
+
+    def stats(self):
+        return {scope: limiter.stats() for scope, limiter in self.limiters.items()}
+
+
+class RestBackpressure:
+    """Delays or sheds incoming work only when outbound REST traffic nears Discord's limit
+
+    install() wraps the bot's HTTP client so every request is counted in
+    per-second slots. admit() lets work straight through below `soft` of the
+    limit, adds a delay that grows towards `max_delay` between `soft` and
+    `hard`, and sheds work above `hard` or shortly after a 429.
+    """
+
+    def __init__(self, limit=REST_RATE_LIMIT, soft=0.6, hard=0.9, window=5, max_delay=1.0, cooldown=5.0):
+        self.limit = limit
+        self.soft = soft
+        self.hard = hard
+        self.window = window
+        self.max_delay = max_delay
+        self.cooldown = cooldown
+        self._counts = [0] * window
+        self._seconds = [0] * window
+        self._limited_until = 0.0
+        self.metrics = {'requests': 0, 'rate_limited': 0, 'admitted': 0, 'delayed': 0, 'shed': 0}
+
+    def install(self, http):
+        """Wrap http.request so outbound requests and 429s are measured"""
+        original = http.request
+
+        async def request(route, **kwargs):
+            self.record()
+            try:
+                return await original(route, **kwargs)
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    self.record_rate_limited()
+                raise
+
+        http.request = request
+
+    def record(self, now=None):
+        second = int(now or time.monotonic())
+        slot = second % self.window
+        if self._seconds[slot] != second:
+            self._seconds[slot] = second
+            self._counts[slot] = 0
+        self._counts[slot] += 1
+        self.metrics['requests'] += 1
+
+    def record_rate_limited(self):
+        self._limited_until = time.monotonic() + self.cooldown
+        self.metrics['rate_limited'] += 1
+
+    def rate(self, now=None):
+        """Outbound requests per second over the last `window` seconds"""
+        second = int(now or time.monotonic())
+        recent = sum(count for count, at in zip(self._counts, self._seconds) if second - at < self.window)
+        return recent / self.window
+
+    def load(self, now=None):
+        now = now or time.monotonic()
+        if now < self._limited_until:
+            return 1.0
+        return self.rate(now) / self.limit
+
+    async def admit(self):
+        """Wait as long as the current REST load calls for; False means drop the work"""
+        load = self.load()
+        if load < self.soft:
+            self.metrics['admitted'] += 1
+            return True
+        if load >= self.hard:
+            self.metrics['shed'] += 1
+            return False
+        self.metrics['delayed'] += 1
+        await asyncio.sleep(self.max_delay * (load - self.soft) / (self.hard - self.soft))
+        return True
+
+    def stats(self):
+        return dict(self.metrics, rest_rate=round(self.rate(), 2), load=round(self.load(), 3))
@@ -0,0 +1,180 @@
+"""
+Persistent timer scheduler for Discord Bot
+One-shot timers (reminders, ...) stored in SQLite and fired by a single sleeper task
+"""
+
+import asyncio
+import heapq
+import os
+import time
+
+from utils import json_dumps, json_loads
+
+# A failing handler is retried after TIMER_RETRY_BASE seconds, doubling up to
+# TIMER_RETRY_MAX, and the timer is dropped after TIMER_MAX_ATTEMPTS failures
+TIMER_MAX_ATTEMPTS = int(os.getenv('TIMER_MAX_ATTEMPTS', '5'))
+TIMER_RETRY_BASE = float(os.getenv('TIMER_RETRY_BASE', '30'))
+TIMER_RETRY_MAX = float(os.getenv('TIMER_RETRY_MAX', '3600'))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS timers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    due REAL NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS timers_due ON timers (due);
+'''
+
+
+class TimerScheduler:
+    """Min-heap of (due, timer_id) with the timer payloads kept on disk
+
+    Memory per pending timer is one small tuple; the payload is only read
+    back when the timer fires. A single task sleeps until the earliest due
+    time and is woken early when a sooner timer is scheduled. Timers that
+    came due while the bot was offline fire once the bot is ready.
+
+    Handlers run as separate tasks, so a slow one doesn't hold up the timers
+    due after it. A timer's row is only deleted once its handler succeeds;
+    failures are rescheduled with backoff, so a timer fires at least once.
+    """
+
+    def __init__(self, conn, max_attempts=TIMER_MAX_ATTEMPTS, retry_base=TIMER_RETRY_BASE, retry_max=TIMER_RETRY_MAX):
+        self.conn = conn
+        self.conn.executescript(SCHEMA)
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._heap = []
+        self._handlers = {}
+        self._firing = set()
+        self._ready = None
+        self._wake = None
+        self._task = None
+        self.metrics = {'scheduled': 0, 'fired': 0, 'cancelled': 0, 'errors': 0, 'retried': 0, 'dropped': 0}
+
+    def register(self, kind, handler):
+        """Set the coroutine function called with the payload when a `kind` timer fires"""
+        self._handlers[kind] = handler
+
+    def load(self):
+        """Rebuild the heap from the timers table"""
+        self._heap = [(due, timer_id) for timer_id, due in self.conn.execute('SELECT id, due FROM timers')]
+        heapq.heapify(self._heap)
+        return len(self._heap)
+
+    def schedule(self, kind, due, payload):
+        """Persist a timer firing at unix time `due`; returns its ID"""
+        cursor = self.conn.execute('INSERT INTO timers (due, kind, payload) VALUES (?, ?, ?)',
+                                   (due, kind, json_dumps(payload).decode('utf-8')))
+        timer_id = cursor.lastrowid
+        self._push(due, timer_id)
+        self.metrics['scheduled'] += 1
+        return timer_id
+
+    def _push(self, due, timer_id):
+        heapq.heappush(self._heap, (due, timer_id))
+        # Only the sleeper needs to know, and only if this is now the earliest timer
+        if self._wake is not None and self._heap[0][1] == timer_id:
+            self._wake.set()
+
+    def cancel(self, timer_id):
+        """Delete a pending timer; its heap entry is skipped when it comes due"""
+        deleted = self.conn.execute('DELETE FROM timers WHERE id = ?', (timer_id,)).rowcount
+        self.metrics['cancelled'] += deleted
+        return bool(deleted)
+
+    def pending(self, kind=None):
+        if kind is None:
+            return self.conn.execute('SELECT COUNT(*) FROM timers').fetchone()[0]
+        return self.conn.execute('SELECT COUNT(*) FROM timers WHERE kind = ?', (kind,)).fetchone()[0]
+
+    def start(self, ready=None):
+        """Load pending timers and start the sleeper task on the running loop
+
+        `ready` is awaited before the first timer fires (e.g. bot.wait_until_ready).
+        """
+        if self._task is not None:
+            return
+        self._ready = ready
+        count = self.load()
+        print(f"⏰ Loaded {count} pending timers")
+        self._wake = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        if self._ready is not None:
+            await self._ready()
+        while True:
+            self._wake.clear()
+            if not self._heap:
+                await self._wake.wait()
+                continue
+
+            due, timer_id = self._heap[0]
+            delay = due - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            task = asyncio.create_task(self._fire(timer_id))
+            self._firing.add(task)
+            task.add_done_callback(self._firing.discard)
+
+    async def _fire(self, timer_id):
+        row = self.conn.execute('SELECT kind, payload, attempts FROM timers WHERE id = ?', (timer_id,)).fetchone()
+        if row is None:
+            return  # Cancelled
+        kind, payload, attempts = row
+        handler = self._handlers.get(kind)
+        if handler is None:
+            print(f"❌ No handler for {kind} timer {timer_id}")
+            self.conn.execute('DELETE FROM timers WHERE id = ?', (timer_id,))
+            self.metrics['errors'] += 1
+            return
+        try:
+            await handler(json_loads(payload))
+        except Exception as e:
+            self.metrics['errors'] += 1
+            self._retry(kind, timer_id, attempts + 1, e)
+            return
+        self.conn.execute('DELETE FROM timers WHERE id = ?', (timer_id,))
+        self.metrics['fired'] += 1
+
+    def _retry(self, kind, timer_id, attempts, error):
+        if attempts >= self.max_attempts:
+            self.conn.execute('DELETE FROM timers WHERE id = ?', (timer_id,))
+            self.metrics['dropped'] += 1
+            print(f"❌ Dropping {kind} timer {timer_id} after {attempts} failed attempts: {error}")
+            return
+        delay = min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+        due = time.time() + delay
+        updated = self.conn.execute('UPDATE timers SET due = ?, attempts = ? WHERE id = ?',
+                                    (due, attempts, timer_id)).rowcount
+        if updated:  # Not cancelled while the handler ran
+            self._push(due, timer_id)
+            self.metrics['retried'] += 1
+            print(f"⚠️ Error firing {kind} timer {timer_id}: {error}, retrying in {delay:.0f}s")
+
+    async def close(self):
+        # Handlers cut short here keep their rows and fire again after the next start
+        tasks = [self._task, *self._firing] if self._task is not None else list(self._firing)
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._firing.clear()
+
+    def stats(self):
+        next_due = self._heap[0][0] - time.time() if self._heap else None
+        return dict(self.metrics, pending=len(self._heap), firing=len(self._firing), next_due_in=round(next_due, 1) if next_due is not None else None)
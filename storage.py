@@ -0,0 +1,1027 @@
+"""
+Storage backends for Discord Moderation Bot
+Pluggable persistence for bot.data: whole-file JSON (default), per-guild JSON shards or SQLite in WAL mode
+Sharded and SQLite backends load guilds lazily and keep only recently active guilds resident
+Includes a one-shot importer from the data.json / data_backup.json layout
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+
+from migrations import SCHEMA_VERSION, migrate_data, migrate_shard
+from utils import BotData, GuildConfig, check_schema, decode_data, json_dumps, json_loads
+
+DATA_FILE = 'data.json'
+BACKUP_FILE = 'data_backup.json'
+JOURNAL_FILE = os.getenv('STORAGE_JOURNAL', 'data.journal')
+DB_PATH = os.getenv('STORAGE_DB_PATH', 'kabu.db')
+SHARD_DIR = os.getenv('STORAGE_SHARD_DIR', 'guild_data')
+GLOBAL_SHARD = '_global.json'
+
+# Guilds kept in memory by lazily-loading backends before LRU eviction kicks in
+MAX_RESIDENT_GUILDS = int(os.getenv('STORAGE_MAX_GUILDS', '1000'))
+
+# Seconds to wait after the first save request so a burst of changes is written once
+FLUSH_DELAY = float(os.getenv('STORAGE_FLUSH_DELAY', '2'))
+
+# Journal size at which the JSON backend folds it into a fresh data.json snapshot
+JOURNAL_MAX_BYTES = int(os.getenv('STORAGE_JOURNAL_MAX_BYTES', str(1024 * 1024)))
+
+OWNER_ID = 957110332495630366
+
+# Top-level keys every bot.data dict must have
+DEFAULT_DATA = {
+    'no_prefix_users': [OWNER_ID],  # Include owner by default
+    'custom_commands': {},
+    'guild_prefixes': {},
+    'stolen_emojis': {},
+    'stolen_stickers': {},
+    'embeds': {},
+    'welcome': {},
+    'autoroles': {},
+    'autoroles_bot': {},
+    'aliases': {},
+    'gpd_enabled': {}
+}
+
+# Sections stored one row per (guild, name)
+KEYED_SECTIONS = {
+    'custom_commands': ('custom_commands', 'name'),
+    'aliases': ('aliases', 'alias'),
+    'embeds': ('embeds', 'name'),
+}
+
+# Sections stored one row per guild
+GUILD_SECTIONS = ('guild_prefixes', 'welcome', 'autoroles', 'autoroles_bot')
+
+# Autorole sections share a table, split by member kind
+AUTOROLE_KINDS = {'autoroles': 'member', 'autoroles_bot': 'bot'}
+
+# Sections split per guild by lazily-loading backends
+SHARDED_SECTIONS = tuple(KEYED_SECTIONS) + GUILD_SECTIONS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS guild_prefixes (
+    guild_id TEXT PRIMARY KEY,
+    prefix TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS custom_commands (
+    guild_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (guild_id, name)
+);
+CREATE TABLE IF NOT EXISTS aliases (
+    guild_id TEXT NOT NULL,
+    alias TEXT NOT NULL,
+    command TEXT NOT NULL,
+    PRIMARY KEY (guild_id, alias)
+);
+CREATE TABLE IF NOT EXISTS embeds (
+    guild_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (guild_id, name)
+);
+CREATE TABLE IF NOT EXISTS welcome (
+    guild_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS autoroles (
+    guild_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (guild_id, kind)
+);
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def default_data():
+    """Return a fresh copy of the default data layout"""
+    return json.loads(json.dumps(DEFAULT_DATA))
+
+
+def apply_defaults(data):
+    """Fill in any missing top-level keys, returning the names that were added"""
+    added = []
+    for key, default_value in DEFAULT_DATA.items():
+        if key not in data:
+            data[key] = json.loads(json.dumps(default_value))
+            added.append(key)
+    return added
+
+
+def connect(path=DB_PATH):
+    """Open a SQLite connection tuned for a single writer with concurrent readers"""
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=5000')
+    return conn
+
+
+class StorageBackend:
+    """Base class for bot.data persistence backends
+
+    prepare() runs on the event loop and snapshots whatever it needs from the
+    live data; commit() runs on the flusher's executor thread and does the I/O.
+    """
+    name = 'base'
+
+    def load(self):
+        raise NotImplementedError
+
+    def prepare(self, data, changes=None):
+        """Snapshot the records in changes (None means everything) into a payload"""
+        raise NotImplementedError
+
+    def commit(self, payload):
+        """Write a prepared payload to disk"""
+        raise NotImplementedError
+
+    def write(self, data, changes=None):
+        """Synchronously persist data, bypassing the flusher"""
+        self.commit(self.prepare(data, changes))
+
+    def open(self):
+        """Reopen anything close() released (the bot can be started again after closing)"""
+
+    def pin(self, guild_id):
+        """Keep a guild with unsaved changes resident until it is flushed"""
+
+    def unpin(self, guild_ids):
+        pass
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class GuildShardCache:
+    """LRU cache of per-guild shards ({section: value}) loaded on first access"""
+
+    def __init__(self, loader, max_guilds=MAX_RESIDENT_GUILDS):
+        self.loader = loader
+        self.max_guilds = max_guilds
+        self._shards = OrderedDict()
+        self._pinned = set()
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, guild_id):
+        """Return a guild's shard, loading it from disk if it isn't resident"""
+        shard = self._shards.get(guild_id)
+        if shard is None:
+            shard = self.loader(guild_id)
+            self.loads += 1
+            self._shards[guild_id] = shard
+            self._evict(keep=guild_id)
+        else:
+            self._shards.move_to_end(guild_id)
+        return shard
+
+    def put(self, guild_id, shard):
+        """Add a shard loaded off the event loop, unless the guild became resident meanwhile"""
+        if guild_id in self._shards:
+            return
+        self.loads += 1
+        self._shards[guild_id] = shard
+        self._evict(keep=guild_id)
+
+    def __contains__(self, guild_id):
+        return guild_id in self._shards
+
+    def resident(self):
+        return list(self._shards.items())
+
+    def pin(self, guild_id):
+        self._pinned.add(guild_id)
+
+    def unpin(self, guild_ids):
+        self._pinned.difference_update(guild_ids)
+        self._evict()
+
+    def _evict(self, keep=None):
+        # Drop least recently used guilds, never ones with unsaved changes
+        while len(self._shards) > self.max_guilds:
+            for guild_id in self._shards:
+                if guild_id not in self._pinned and guild_id != keep:
+                    break
+            else:
+                return
+            del self._shards[guild_id]
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            'resident_guilds': len(self._shards),
+            'max_guilds': self.max_guilds,
+            'guild_loads': self.loads,
+            'guild_evictions': self.evictions,
+        }
+
+
+class GuildSection(MutableMapping):
+    """A bot.data section whose per-guild entries live in the shard cache
+
+    Lookups load the guild on first access. Iteration and len() only cover
+    guilds that are currently resident.
+    """
+
+    def __init__(self, section, cache):
+        self.section = section
+        self.cache = cache
+
+    def __getitem__(self, guild_id):
+        return self.cache.get(guild_id)[self.section]
+
+    def __setitem__(self, guild_id, value):
+        self.cache.get(guild_id)[self.section] = value
+
+    def __delitem__(self, guild_id):
+        del self.cache.get(guild_id)[self.section]
+
+    def __iter__(self):
+        return iter([guild_id for guild_id, shard in self.cache.resident() if self.section in shard])
+
+    def __len__(self):
+        return sum(1 for _, shard in self.cache.resident() if self.section in shard)
+
+    def __repr__(self):
+        return f'<GuildSection {self.section} resident={len(self)}>'
+
+
+class LazyGuildStorage(StorageBackend):
+    """Backend that loads guild sections one guild at a time"""
+
+    def __init__(self):
+        self.cache = GuildShardCache(self._load_migrated)
+
+    def _load_migrated(self, guild_id):
+        # Shards are migrated as they load; unchanged on disk until next saved
+        shard = self.load_guild(guild_id)
+        migrate_shard(shard)
+        return shard
+
+    def load_guild(self, guild_id):
+        """Return {section: value} for one guild"""
+        raise NotImplementedError
+
+    def read_guild(self, guild_id):
+        """Load and migrate a guild on the flusher's executor thread (see WriteBehindFlusher.preload)"""
+        return self._load_migrated(guild_id)
+
+    def load_global(self):
+        """Return the non-guild sections"""
+        raise NotImplementedError
+
+    def load(self):
+        data = self.load_global()
+        for section in SHARDED_SECTIONS:
+            data[section] = GuildSection(section, self.cache)
+        data['schema_version'] = SCHEMA_VERSION
+        for key in apply_defaults(data):
+            print(f"🔧 Added missing key: {key}")
+        return data
+
+    def pin(self, guild_id):
+        self.cache.pin(guild_id)
+
+    def unpin(self, guild_ids):
+        self.cache.unpin(guild_ids)
+
+    def stats(self):
+        return self.cache.stats()
+
+
+class JsonStorage(StorageBackend):
+    """data.json snapshot plus an append-only journal of record changes
+
+    Each flush appends one line per changed record to the journal. Once the
+    journal passes JOURNAL_MAX_BYTES the next flush writes a fresh snapshot
+    and truncates it. Startup replays the journal on top of the snapshot.
+    """
+    name = 'json'
+
+    def __init__(self, path=DATA_FILE, journal_path=JOURNAL_FILE, max_journal_bytes=JOURNAL_MAX_BYTES):
+        self.path = path
+        self.journal_path = journal_path
+        self.max_journal_bytes = max_journal_bytes
+        self.journal_bytes = 0
+        self.metrics = {'journal_records': 0, 'compactions': 0}
+
+    def load(self):
+        """Load persistent data from JSON file with enhanced error handling"""
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'rb') as f:
+                    data = decode_data(f.read())
+            else:
+                # Create default data if file doesn't exist
+                data = default_data()
+
+            replayed, self.journal_bytes = replay_journal(data, self.journal_path)
+            if replayed:
+                print(f"📜 Replayed {replayed} journal records")
+
+            # Ensure all required keys exist with defaults
+            for key in apply_defaults(data):
+                print(f"🔧 Added missing key: {key}")
+
+            return data
+
+        except ValueError as e:
+            print(f"❌ Error reading {self.path} (corrupted): {e}")
+            # Backup corrupted file and create new one
+            try:
+                shutil.copy(self.path, f'data_backup_corrupted_{int(time.time())}.json')
+                print(f"📁 Corrupted {self.path} backed up")
+            except:
+                pass
+            return default_data()
+
+        except Exception as e:
+            print(f"❌ Error loading data: {e}")
+            return default_data()
+
+    def prepare(self, data, changes=None):
+        if changes is None or self.journal_bytes >= self.max_journal_bytes:
+            # Full save or compaction: the snapshot supersedes the whole journal
+            return 'snapshot', json_dumps(data)
+        return 'journal', b''.join(_journal_line(data, *change) for change in changes)
+
+    def commit(self, payload):
+        kind, blob = payload
+        if kind == 'snapshot':
+            atomic_write(self.path, blob)
+            # A crash before the truncate only means replaying records the snapshot already holds
+            with open(self.journal_path, 'wb') as f:
+                os.fsync(f.fileno())
+            if self.journal_bytes:
+                self.metrics['compactions'] += 1
+            self.journal_bytes = 0
+            return
+
+        with open(self.journal_path, 'ab') as f:
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_bytes += len(blob)
+        self.metrics['journal_records'] += blob.count(b'\n')
+
+    def stats(self):
+        return dict(self.metrics, journal_bytes=self.journal_bytes)
+
+
+class SQLiteStorage(LazyGuildStorage):
+    """SQLite storage in WAL mode with one row per guild setting
+
+    The event loop reads through `conn`. Commits and preloads run on the
+    flusher's executor thread through their own `writer` connection, which
+    flush_sync may also use from the loop, hence the write lock.
+    """
+    name = 'sqlite'
+
+    def __init__(self, path=DB_PATH):
+        super().__init__()
+        self.path = path
+        self.conn = None
+        self.writer = None
+        self._write_lock = threading.Lock()
+        self.open()
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        self.conn.executescript(SCHEMA)
+        if version == 0:
+            # First start on this database: pull in the existing JSON files
+            imported = import_json(self.conn, [BACKUP_FILE, DATA_FILE])
+            if imported:
+                print(f"📥 Imported {', '.join(imported)} into {self.path}")
+            self.conn.execute('PRAGMA user_version = 1')
+
+    def open(self):
+        if self.conn is None:
+            self.conn = connect(self.path)
+            self.writer = connect(self.path)
+
+    def load_global(self):
+        return {key: json_loads(value) for key, value in self.conn.execute('SELECT key, value FROM kv')}
+
+    def load_guild(self, guild_id, conn=None):
+        """Read one guild's rows from every table"""
+        conn = conn or self.conn
+        shard = {}
+        row = conn.execute('SELECT prefix FROM guild_prefixes WHERE guild_id = ?', (guild_id,)).fetchone()
+        if row:
+            shard['guild_prefixes'] = row[0]
+
+        for section, (table, column) in KEYED_SECTIONS.items():
+            value_column = 'command' if section == 'aliases' else 'data'
+            rows = conn.execute(f'SELECT {column}, {value_column} FROM {table} WHERE guild_id = ?', (guild_id,))
+            values = {name: value if section == 'aliases' else json_loads(value) for name, value in rows}
+            if values:
+                shard[section] = values
+
+        row = conn.execute('SELECT data FROM welcome WHERE guild_id = ?', (guild_id,)).fetchone()
+        if row:
+            shard['welcome'] = json_loads(row[0])
+
+        for section, kind in AUTOROLE_KINDS.items():
+            row = conn.execute('SELECT data FROM autoroles WHERE guild_id = ? AND kind = ?', (guild_id, kind)).fetchone()
+            if row:
+                shard[section] = json_loads(row[0])
+        return shard
+
+    def _migrated(self, guild_id, shard):
+        # Rows are checked only after migrating, and a mismatch is logged, never fatal
+        migrate_shard(shard)
+        check_schema(shard, GuildConfig, f"Guild {guild_id}")
+        return shard
+
+    def _load_migrated(self, guild_id):
+        return self._migrated(guild_id, self.load_guild(guild_id))
+
+    def read_guild(self, guild_id):
+        with self._write_lock:
+            shard = self.load_guild(guild_id, self.writer)
+        return self._migrated(guild_id, shard)
+
+    def prepare(self, data, changes=None):
+        """Turn the changed records into a list of SQL statements"""
+        if changes is None:
+            # Rewrites every resident guild; guilds that were never loaded are unchanged on disk
+            return _data_statements(data)
+
+        statements = []
+        for section, guild_id, key in changes:
+            statements.extend(_record_statements(data, section, guild_id, key))
+        return statements
+
+    def commit(self, payload):
+        with self._write_lock:
+            self.writer.execute('BEGIN IMMEDIATE')
+            try:
+                for sql, params in payload:
+                    self.writer.execute(sql, params)
+                self.writer.execute('COMMIT')
+            except Exception:
+                self.writer.execute('ROLLBACK')
+                raise
+
+    def close(self):
+        if self.conn is not None:
+            with self._write_lock:
+                self.writer.close()
+            self.conn.close()
+            self.conn = self.writer = None
+
+
+class ShardedJsonStorage(LazyGuildStorage):
+    """One JSON file per guild plus a file for global settings"""
+    name = 'sharded'
+
+    def __init__(self, shard_dir=SHARD_DIR):
+        super().__init__()
+        self.shard_dir = shard_dir
+        if not os.path.isdir(shard_dir):
+            # First start with shards: split the existing JSON files
+            split = split_json(shard_dir, [BACKUP_FILE, DATA_FILE])
+            if split:
+                print(f"📥 Split {', '.join(split)} into {shard_dir}/")
+            os.makedirs(shard_dir, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.shard_dir, name)
+
+    def _read(self, path, schema=GuildConfig):
+        try:
+            with open(path, 'rb') as f:
+                return decode_data(f.read(), schema)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            print(f"❌ Error reading {path} (corrupted): {e}")
+            try:
+                shutil.copy(path, f'{path}.corrupted_{int(time.time())}')
+            except:
+                pass
+            return {}
+
+    def load_global(self):
+        return self._read(self._path(GLOBAL_SHARD), BotData)
+
+    def load_guild(self, guild_id):
+        return self._read(self._path(f'{guild_id}.json'))
+
+    def prepare(self, data, changes=None):
+        """Encode the shard files touched by changes"""
+        if changes is None:
+            guild_ids = [guild_id for guild_id, _ in self.cache.resident()]
+            global_dirty = True
+        else:
+            guild_ids = {guild_id for section, guild_id, _ in changes if section in SHARDED_SECTIONS}
+            global_dirty = any(section not in SHARDED_SECTIONS for section, _, _ in changes)
+
+        files = []
+        for guild_id in guild_ids:
+            shard = self.cache.get(guild_id)
+            files.append((self._path(f'{guild_id}.json'), json_dumps(shard) if shard else None))
+        if global_dirty:
+            global_data = {key: value for key, value in data.items() if key not in SHARDED_SECTIONS}
+            files.append((self._path(GLOBAL_SHARD), json_dumps(global_data)))
+        return files
+
+    def commit(self, payload):
+        os.makedirs(self.shard_dir, exist_ok=True)
+        for path, content in payload:
+            if content is None:
+                if os.path.exists(path):
+                    os.remove(path)
+            else:
+                atomic_write(path, content)
+
+
+def atomic_write(path, payload):
+    """Write bytes to a temp file and rename it over path"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+_MISSING = object()
+
+
+def _journal_line(data, section, guild_id=None, key=None):
+    """Encode the current value of one record as a journal line"""
+    record = {'s': section, 'g': guild_id, 'k': key}
+    value = data.get(section, _MISSING)
+    for part in (guild_id, key):
+        if part is None or value is _MISSING:
+            break
+        value = value.get(part, _MISSING) if isinstance(value, dict) else _MISSING
+    if value is _MISSING:
+        record['d'] = 1
+    else:
+        record['v'] = value
+    return json_dumps(record) + b'\n'
+
+
+def replay_journal(data, path):
+    """Apply journal records to data in place; returns (records applied, valid bytes)
+
+    A torn final line from a crash mid-append is cut off so later appends stay parseable.
+    """
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return 0, 0
+
+    applied = 0
+    offset = 0
+    for line in raw.splitlines(keepends=True):
+        try:
+            if not line.endswith(b'\n'):
+                raise ValueError('incomplete record')
+            record = json_loads(line)
+            _apply_record(data, record)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"⚠️ Journal {path} truncated at byte {offset}: {e}")
+            with open(path, 'r+b') as f:
+                f.truncate(offset)
+            break
+        applied += 1
+        offset += len(line)
+    return applied, offset
+
+
+def _apply_record(data, record):
+    section, guild_id, key = record['s'], record['g'], record['k']
+    deleted = 'd' in record
+    path = [part for part in (guild_id, key) if part is not None]
+    if not path:
+        if deleted:
+            data.pop(section, None)
+        else:
+            data[section] = record['v']
+        return
+
+    parent = data.setdefault(section, {})
+    for part in path[:-1]:
+        if deleted and part not in parent:
+            return
+        parent = parent.setdefault(part, {})
+    if deleted:
+        parent.pop(path[-1], None)
+        # Drop guild entries left empty by the delete
+        if key is not None and not parent:
+            data[section].pop(guild_id, None)
+    else:
+        parent[path[-1]] = record['v']
+
+
+def _dumps(value):
+    return json_dumps(value).decode('utf-8')
+
+
+def _record_statements(data, section, guild_id=None, key=None):
+    """Build the upsert/delete statements backing one record of bot.data"""
+    section_data = data.get(section)
+    if section_data is None:
+        section_data = {}
+    statements = []
+
+    if section in KEYED_SECTIONS:
+        table, column = KEYED_SECTIONS[section]
+        guild_data = section_data.get(guild_id) or {}
+        if key is None:
+            statements.append((f'DELETE FROM {table} WHERE guild_id = ?', (guild_id,)))
+            items = guild_data.items()
+        else:
+            statements.append((f'DELETE FROM {table} WHERE guild_id = ? AND {column} = ?', (guild_id, key)))
+            items = [(key, guild_data[key])] if key in guild_data else []
+        for name, value in items:
+            value = value if section == 'aliases' else _dumps(value)
+            statements.append((f'INSERT INTO {table} VALUES (?, ?, ?)', (guild_id, name, value)))
+
+    elif section in GUILD_SECTIONS:
+        value = section_data.get(guild_id)
+        if section == 'guild_prefixes':
+            statements.append(('DELETE FROM guild_prefixes WHERE guild_id = ?', (guild_id,)))
+            if value is not None:
+                statements.append(('INSERT INTO guild_prefixes VALUES (?, ?)', (guild_id, value)))
+        elif section == 'welcome':
+            statements.append(('DELETE FROM welcome WHERE guild_id = ?', (guild_id,)))
+            if value is not None:
+                statements.append(('INSERT INTO welcome VALUES (?, ?)', (guild_id, _dumps(value))))
+        else:
+            kind = AUTOROLE_KINDS[section]
+            statements.append(('DELETE FROM autoroles WHERE guild_id = ? AND kind = ?', (guild_id, kind)))
+            if value is not None:
+                statements.append(('INSERT INTO autoroles VALUES (?, ?, ?)', (guild_id, kind, _dumps(value))))
+
+    else:
+        # Global settings (no-prefix users, stolen emojis, ...) live in the kv table
+        if section not in data:
+            statements.append(('DELETE FROM kv WHERE key = ?', (section,)))
+        else:
+            statements.append(('INSERT OR REPLACE INTO kv VALUES (?, ?)', (section, _dumps(section_data))))
+
+    return statements
+
+
+def _data_statements(data):
+    """Build statements writing every record of a bot.data dict"""
+    statements = []
+    for section, section_data in data.items():
+        if section in KEYED_SECTIONS or section in GUILD_SECTIONS:
+            for guild_id in list(section_data if section_data is not None else {}):
+                statements.extend(_record_statements(data, section, guild_id))
+        else:
+            statements.extend(_record_statements(data, section))
+    return statements
+
+
+def import_json(conn, paths):
+    """Upsert the contents of JSON data files into the database, later files winning"""
+    imported = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, 'rb') as f:
+                data = decode_data(f.read())
+            if path == DATA_FILE:
+                replay_journal(data, JOURNAL_FILE)
+        except (OSError, ValueError) as e:
+            print(f"❌ Skipping {path}: {e}")
+            continue
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for sql, params in _data_statements(data):
+                conn.execute(sql, params)
+            conn.execute('COMMIT')
+            imported.append(path)
+        except Exception as e:
+            conn.execute('ROLLBACK')
+            print(f"❌ Failed to import {path}: {e}")
+    return imported
+
+
+class WriteBehindFlusher:
+    """Collects save requests and writes them from a background task
+
+    save_data/save_record only mark records dirty. The flush task waits
+    FLUSH_DELAY seconds so bursts coalesce, snapshots the dirty records on the
+    event loop and hands the disk I/O to a single-thread executor.
+    """
+
+    def __init__(self, backend, delay=FLUSH_DELAY):
+        self.backend = backend
+        self.delay = delay
+        self.data = None
+        self._dirty = set()
+        self._full = False
+        self._requests = 0
+        self._wake = None
+        self._task = None
+        self._lock = None
+        self._executor = None
+        self._preloading = {}
+        self.metrics = {
+            'save_requests': 0,
+            'coalesced_requests': 0,
+            'flushes': 0,
+            'records_written': 0,
+            'errors': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'avg_flush_ms': 0.0,
+        }
+
+    def mark_dirty(self, data, section=None, guild_id=None, key=None):
+        """Queue a record for the next flush; section=None queues everything"""
+        self.data = data
+        self._requests += 1
+        self.metrics['save_requests'] += 1
+        if section is None:
+            self._full = True
+        else:
+            self._dirty.add((section, guild_id, key))
+            if guild_id is not None:
+                self.backend.pin(guild_id)
+        if self._wake is not None:
+            self._wake.set()
+
+    @property
+    def pending(self):
+        return self._full or bool(self._dirty)
+
+    def start(self):
+        """Start the background flush task on the running loop"""
+        if self._task is not None:
+            return
+        # Recreated on every start, since close() shuts it down and the bot may be started again
+        self.backend.open()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='storage-flush')
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        if self.pending:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            # Debounce: let the rest of the burst arrive before writing
+            await asyncio.sleep(self.delay)
+            await self.flush()
+
+    def _take(self):
+        records = self._dirty
+        changes = None if self._full else sorted(records, key=repr)
+        requests = self._requests
+        self._dirty = set()
+        self._full = False
+        self._requests = 0
+        return changes, requests, records
+
+    def _restore(self, changes, requests, records):
+        if changes is None:
+            self._full = True
+        self._dirty.update(records)
+        self._requests += requests
+
+    def _record_flush(self, started, changes, requests, records):
+        # Guilds without newer pending changes may be evicted again
+        still_dirty = {guild_id for _, guild_id, _ in self._dirty}
+        self.backend.unpin({guild_id for _, guild_id, _ in records if guild_id not in still_dirty})
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        m = self.metrics
+        m['flushes'] += 1
+        m['records_written'] += len(changes) if changes is not None else 1
+        m['coalesced_requests'] += max(requests - 1, 0)
+        m['last_flush_ms'] = round(elapsed_ms, 2)
+        m['max_flush_ms'] = max(m['max_flush_ms'], m['last_flush_ms'])
+        m['avg_flush_ms'] = round(m['avg_flush_ms'] + (elapsed_ms - m['avg_flush_ms']) / m['flushes'], 2)
+
+    async def flush(self):
+        """Write everything that is currently dirty"""
+        async with self._lock:
+            self._wake.clear()
+            if not self.pending or self.data is None:
+                return
+            changes, requests, records = self._take()
+            started = time.perf_counter()
+            try:
+                payload = self.backend.prepare(self.data, changes)
+                await asyncio.get_running_loop().run_in_executor(self._executor, self.backend.commit, payload)
+            except Exception as e:
+                self._restore(changes, requests, records)
+                self.metrics['errors'] += 1
+                print(f"❌ Error saving data: {e}")
+                return
+            self._record_flush(started, changes, requests, records)
+
+    async def preload(self, guild_id):
+        """Load a guild's shard on the executor so its first access doesn't block the event loop"""
+        cache = getattr(self.backend, 'cache', None)
+        if cache is None or guild_id in cache or self._executor is None:
+            return
+        pending = self._preloading.get(guild_id)
+        if pending is None:
+            pending = self._preloading[guild_id] = asyncio.get_running_loop().run_in_executor(
+                self._executor, self.backend.read_guild, guild_id)
+        try:
+            shard = await asyncio.shield(pending)
+        except Exception as e:
+            print(f"❌ Error preloading guild {guild_id}: {e}")
+            return
+        finally:
+            self._preloading.pop(guild_id, None)
+        cache.put(guild_id, shard)
+
+    def flush_sync(self):
+        """Write pending changes immediately from the calling thread"""
+        if not self.pending or self.data is None:
+            return
+        changes, requests, records = self._take()
+        started = time.perf_counter()
+        try:
+            self.backend.write(self.data, changes)
+        except Exception as e:
+            self._restore(changes, requests, records)
+            self.metrics['errors'] += 1
+            print(f"❌ Error saving data: {e}")
+            return
+        self._record_flush(started, changes, requests, records)
+
+    async def close(self):
+        """Stop the flush task, write anything still pending and close the backend"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await self.flush()
+        else:
+            self.flush_sync()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.backend.close()
+        print("💾 Final data flush complete")
+
+    def stats(self):
+        """Flush metrics for the web dashboard"""
+        return dict(self.metrics, backend=self.backend.name, pending=self.pending, **self.backend.stats())
+
+
+class StateStore:
+    """Authoritative in-memory copy of bot.data
+
+    Disk is read once, on first load. Writers mutate the dict and then commit
+    the record they changed, which bumps the version and hands it to the
+    write-behind flusher; readers only ever see memory.
+    """
+
+    def __init__(self, flusher):
+        self.flusher = flusher
+        self.data = None
+        self.version = 0
+
+    def load(self):
+        """Return the live data, reading it from the backend the first time"""
+        if self.data is None:
+            self.data = self.flusher.backend.load()
+            print("💾 Data loaded into the state store")
+            self._migrate()
+        return self.data
+
+    def _migrate(self):
+        current = self.data.get('schema_version', 0)
+        changes = migrate_data(self.data)
+        for version, description, section, guild_id, old, new in changes:
+            self.commit(section, guild_id)
+        if current < SCHEMA_VERSION:
+            self.commit('schema_version')
+            print(f"🔧 Migrated data from schema v{current} to v{SCHEMA_VERSION} ({len(changes)} records)")
+
+    def commit(self, section=None, guild_id=None, key=None):
+        """Record a change to the live data; section=None commits everything"""
+        self.version += 1
+        self.flusher.mark_dirty(self.load(), section, guild_id, key)
+        return self.version
+
+    def snapshot(self):
+        """Return (version, deep copy) of the live data for consistent readers
+
+        Lazily-loading backends only include guilds that are resident.
+        """
+        return self.version, _plain(self.load())
+
+    def stats(self):
+        return {'state_version': self.version}
+
+
+def _plain(value):
+    # Deep-copy mappings (including lazy guild sections) into plain containers
+    if isinstance(value, (dict, MutableMapping)):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
+
+
+def split_json(shard_dir, paths):
+    """Split JSON data files into per-guild shard files, later files winning"""
+    shards = {}
+    global_data = {}
+    split = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, 'rb') as f:
+                data = decode_data(f.read())
+            if path == DATA_FILE:
+                replay_journal(data, JOURNAL_FILE)
+        except (OSError, ValueError) as e:
+            print(f"❌ Skipping {path}: {e}")
+            continue
+
+        for section, section_data in data.items():
+            if section in SHARDED_SECTIONS:
+                for guild_id, value in (section_data or {}).items():
+                    shards.setdefault(guild_id, {})[section] = value
+            else:
+                global_data[section] = section_data
+        split.append(path)
+
+    os.makedirs(shard_dir, exist_ok=True)
+    for guild_id, shard in shards.items():
+        atomic_write(os.path.join(shard_dir, f'{guild_id}.json'), json_dumps(shard))
+    if split:
+        atomic_write(os.path.join(shard_dir, GLOBAL_SHARD), json_dumps(global_data))
+    return split
+
+
+BACKENDS = {
+    'json': JsonStorage,
+    'sharded': ShardedJsonStorage,
+    'sqlite': SQLiteStorage,
+}
+
+
+def create_backend(name):
+    """Create the storage backend selected by STORAGE_BACKEND"""
+    backend_cls = BACKENDS.get((name or 'json').lower())
+    if backend_cls is None:
+        print(f"❌ Unknown storage backend '{name}', falling back to json")
+        backend_cls = JsonStorage
+    return backend_cls()
+
+
+if __name__ == '__main__':
+    # One-shot cutover: python storage.py import [db_path] [json files...]
+    #                   python storage.py split [shard_dir] [json files...]
+    if len(sys.argv) < 2 or sys.argv[1] not in ('import', 'split'):
+        print("Usage: python storage.py import [db_path] [data_backup.json data.json ...]")
+        print("       python storage.py split [shard_dir] [data_backup.json data.json ...]")
+        sys.exit(1)
+
+    if sys.argv[1] == 'split':
+        shard_dir = sys.argv[2] if len(sys.argv) > 2 else SHARD_DIR
+        split = split_json(shard_dir, sys.argv[3:] or [BACKUP_FILE, DATA_FILE])
+        print(f"✅ Split {len(split)} file(s) into {shard_dir}/: {', '.join(split) or 'none'}")
+        sys.exit(0)
+
+    db_path = sys.argv[2] if len(sys.argv) > 2 else DB_PATH
+    paths = sys.argv[3:] or [BACKUP_FILE, DATA_FILE]
+    conn = connect(db_path)
+    conn.executescript(SCHEMA)
+    imported = import_json(conn, paths)
+    conn.execute('PRAGMA user_version = 1')
+    conn.close()
+    print(f"✅ Imported {len(imported)} file(s) into {db_path}: {', '.join(imported) or 'none'}")
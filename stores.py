@@ -0,0 +1,167 @@
+"""
+Persistent stores for Discord Bot
+SQLite-backed state kept out of bot.data: warnings and AFK statuses
+"""
+
+import time
+
+WARNINGS_PER_PAGE = 10
+
+WARNING_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS warnings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    moderator_id INTEGER NOT NULL,
+    moderator TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS warnings_member ON warnings (guild_id, user_id, id);
+CREATE TABLE IF NOT EXISTS warning_counts (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+'''
+
+
+class WarningRecord:
+    """One stored warning"""
+    __slots__ = ('id', 'guild_id', 'user_id', 'moderator_id', 'moderator', 'reason', 'created')
+
+    def __init__(self, id, guild_id, user_id, moderator_id, moderator, reason, created):
+        self.id = id
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.moderator_id = moderator_id
+        self.moderator = moderator
+        self.reason = reason
+        self.created = created
+
+
+class WarningStore:
+    """Warning log indexed by (guild, user)
+
+    Each member's total is kept in warning_counts, updated in the same
+    transaction as the insert or delete, so counts never scan the log.
+    Pages are read newest-first straight off the (guild_id, user_id, id)
+    index, so a member with thousands of warnings costs one page to show.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.executescript(WARNING_SCHEMA)
+        self.metrics = {'added': 0, 'cleared': 0, 'queries': 0}
+
+    def _transaction(self, statements):
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            results = [self.conn.execute(sql, params) for sql, params in statements]
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        return results
+
+    def add(self, guild_id, user_id, moderator_id, moderator, reason):
+        """Store a warning and return the member's new total"""
+        self._transaction([
+            ('INSERT INTO warnings (guild_id, user_id, moderator_id, moderator, reason, created) VALUES (?, ?, ?, ?, ?, ?)',
+             (guild_id, user_id, moderator_id, moderator, reason, time.time())),
+            ('INSERT INTO warning_counts (guild_id, user_id, count) VALUES (?, ?, 1) '
+             'ON CONFLICT (guild_id, user_id) DO UPDATE SET count = count + 1',
+             (guild_id, user_id)),
+        ])
+        self.metrics['added'] += 1
+        return self.count(guild_id, user_id)
+
+    def count(self, guild_id, user_id):
+        row = self.conn.execute('SELECT count FROM warning_counts WHERE guild_id = ? AND user_id = ?',
+                                (guild_id, user_id)).fetchone()
+        return row[0] if row else 0
+
+    def page(self, guild_id, user_id, page=1, per_page=WARNINGS_PER_PAGE):
+        """Return one page of a member's warnings, newest first (page 1 = latest)"""
+        self.metrics['queries'] += 1
+        rows = self.conn.execute(
+            'SELECT * FROM warnings WHERE guild_id = ? AND user_id = ? ORDER BY id DESC LIMIT ? OFFSET ?',
+            (guild_id, user_id, per_page, (max(page, 1) - 1) * per_page)
+        ).fetchall()
+        return [WarningRecord(*row) for row in rows]
+
+    def clear(self, guild_id, user_id):
+        """Delete all of a member's warnings; returns how many were removed"""
+        params = (guild_id, user_id)
+        deleted, _ = self._transaction([
+            ('DELETE FROM warnings WHERE guild_id = ? AND user_id = ?', params),
+            ('DELETE FROM warning_counts WHERE guild_id = ? AND user_id = ?', params),
+        ])
+        self.metrics['cleared'] += deleted.rowcount
+        return deleted.rowcount
+
+    def stats(self):
+        total = self.conn.execute('SELECT COALESCE(SUM(count), 0), COUNT(*) FROM warning_counts').fetchone()
+        return dict(self.metrics, warnings=total[0], warned_members=total[1])
+
+
+AFK_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS afk (
+    user_id INTEGER PRIMARY KEY,
+    reason TEXT NOT NULL,
+    since REAL NOT NULL
+);
+'''
+
+
+class AfkRegistry:
+    """Persistent AFK statuses with an in-memory set of AFK user IDs
+
+    on_message only needs set membership: the author check and all mention
+    checks are one set intersection, and the database is only read for the
+    users that actually matched.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.executescript(AFK_SCHEMA)
+        self._ids = {user_id for (user_id,) in self.conn.execute('SELECT user_id FROM afk')}
+        self.metrics = {'set': 0, 'returned': 0, 'mention_hits': 0}
+
+    def __contains__(self, user_id):
+        return user_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def set(self, user_id, reason):
+        self.conn.execute('INSERT OR REPLACE INTO afk (user_id, reason, since) VALUES (?, ?, ?)',
+                          (user_id, reason, time.time()))
+        self._ids.add(user_id)
+        self.metrics['set'] += 1
+
+    def pop(self, user_id):
+        """Clear a user's AFK status; returns (reason, since) or None if they weren't AFK"""
+        if user_id not in self._ids:
+            return None
+        self._ids.discard(user_id)
+        row = self.conn.execute('SELECT reason, since FROM afk WHERE user_id = ?', (user_id,)).fetchone()
+        self.conn.execute('DELETE FROM afk WHERE user_id = ?', (user_id,))
+        self.metrics['returned'] += 1
+        return row
+
+    def lookup(self, user_ids):
+        """Return {user_id: (reason, since)} for the AFK users among user_ids, in one query"""
+        matched = self._ids.intersection(user_ids)
+        if not matched:
+            return {}
+        self.metrics['mention_hits'] += len(matched)
+        placeholders = ','.join('?' * len(matched))
+        rows = self.conn.execute(f'SELECT user_id, reason, since FROM afk WHERE user_id IN ({placeholders})',
+                                 tuple(matched))
+        return {user_id: (reason, since) for user_id, reason, since in rows}
+
+    def stats(self):
+        return dict(self.metrics, afk_users=len(self._ids))
+
@@ -11,9 +11,21 @@ import threading
 import time
 from datetime import datetime
 from flask import Flask, jsonify
+from typing import Any, Dict, List, Optional, TypedDict, Union
 import re
 import io
 
+# Optional fast JSON codecs - stdlib json is used when neither is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
 # Bot Configuration
 EMBED_COLOR = discord.Color.from_rgb(255, 192, 203)
 FOOTER_TEXT = "Made by Onevibe"
@@ -307,6 +319,24 @@ def api_status():
             'error': str(e)
         })
 
+# Named metric providers shown at /api/metrics
+metrics_providers = {}
+
+def register_metrics(name, provider):
+    """Expose a callable returning a dict of metrics under /api/metrics"""
+    metrics_providers[name] = provider
+
+@app.route('/api/metrics')
+def api_metrics():
+    """API endpoint for internal subsystem metrics"""
+    metrics = {}
+    for name, provider in list(metrics_providers.items()):
+        try:
+            metrics[name] = provider()
+        except Exception as e:
+            metrics[name] = {'error': str(e)}
+    return jsonify(metrics)
+
 @app.route('/api/ping')
 def api_ping():
     """Simple ping endpoint to keep bot alive"""
@@ -387,140 +417,194 @@ def update_bot_stats(bot):
     except Exception as e:
         print(f"❌ stats update error: {e}")
 
-# Enhanced persistent storage functions with backup system
-def load_data():
-    """Load persistent data from JSON file with enhanced error handling"""
+# Typed schemas for stored configuration. With msgspec as the codec, decoded
+# documents are checked against these; keys not listed here are kept as-is.
+class CustomCommand(TypedDict, total=False):
+    role_id: int
+    role_name: str
+    role: str
+    description: str
+    created_by: int
+
+class EmbedAuthor(TypedDict, total=False):
+    name: Optional[str]
+    icon_url: Optional[str]
+
+class EmbedData(TypedDict, total=False):
+    title: Optional[str]
+    description: Optional[str]
+    color: Union[str, int, None]
+    thumbnail: Optional[str]
+    image: Optional[str]
+    footer: Optional[str]
+    author: EmbedAuthor
+    author_name: Optional[str]
+    author_icon: Optional[str]
+    timestamp: bool
+
+class WelcomeConfig(TypedDict, total=False):
+    embed_name: str
+    channel_id: int
+    enabled: bool
+    message: str
+
+# Autoroles may still be stored as a single ID string/int or a list of IDs
+AutoroleValue = Union[List[Union[str, int]], str, int]
+
+class GuildConfig(TypedDict, total=False):
+    """One guild's settings, as stored by the sharded backend"""
+    guild_prefixes: str
+    custom_commands: Dict[str, Union[CustomCommand, int, str]]
+    aliases: Dict[str, str]
+    embeds: Dict[str, EmbedData]
+    welcome: WelcomeConfig
+    autoroles: AutoroleValue
+    autoroles_bot: AutoroleValue
+
+class BotData(TypedDict, total=False):
+    """The whole bot.data document, as stored in data.json"""
+    schema_version: int
+    no_prefix_users: List[int]
+    custom_commands: Dict[str, Dict[str, Union[CustomCommand, int, str]]]
+    guild_prefixes: Dict[str, str]
+    stolen_emojis: Dict[str, Any]
+    stolen_stickers: Dict[str, Any]
+    embeds: Dict[str, Dict[str, EmbedData]]
+    welcome: Dict[str, WelcomeConfig]
+    autoroles: Dict[str, AutoroleValue]
+    autoroles_bot: Dict[str, AutoroleValue]
+    aliases: Dict[str, Dict[str, str]]
+    gpd_enabled: Dict[str, Any]
+    guild_data: Dict[str, Any]
+
+def _pick_codec():
+    """Pick the JSON codec: JSON_CODEC env override, else the fastest installed"""
+    available = ['stdlib']
+    if orjson is not None:
+        available.insert(0, 'orjson')
+    if msgspec is not None:
+        available.insert(0, 'msgspec')
+    requested = os.getenv('JSON_CODEC', '').lower()
+    return requested if requested in available else available[0]
+
+JSON_CODEC = _pick_codec()
+
+def json_dumps(obj):
+    """Encode obj as compact UTF-8 JSON bytes"""
+    if JSON_CODEC == 'orjson':
+        # Older saves may hold int keys, which stdlib json silently stringifies
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    if JSON_CODEC == 'msgspec':
+        return msgspec.json.encode(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def json_loads(raw):
+    """Decode JSON bytes/str with the selected codec
+
+    Raises ValueError (or a subclass) for malformed JSON.
+    """
+    if JSON_CODEC == 'orjson':
+        return orjson.loads(raw)
+    if JSON_CODEC == 'msgspec':
+        return msgspec.json.decode(raw)
+    return json.loads(raw)
+
+def check_schema(data, schema, label='Stored data'):
+    """Warn if data doesn't match schema (msgspec codec only); data is never changed or rejected"""
+    if JSON_CODEC != 'msgspec':
+        return True
     try:
-        if not os.path.exists('data.json'):
-            # Create default data if file doesn't exist
-            default_data = {
-                'no_prefix_users': [957110332495630366],  # Include owner by default
-                'custom_commands': {},
-                'guild_prefixes': {},
-                'stolen_emojis': {},
-                'stolen_stickers': {},
-                'embeds': {},
-                'welcome': {},
-                'autoroles': {},
-                'autoroles_bot': {},
-                'aliases': {},
-                'gpd_enabled': {}
-            }
-            save_data(default_data)
-            return default_data
-
-        with open('data.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        # Ensure all required keys exist with defaults
-        required_keys = {
-            'no_prefix_users': [957110332495630366],
-            'custom_commands': {},
-            'guild_prefixes': {},
-            'stolen_emojis': {},
-            'stolen_stickers': {},
-            'embeds': {},
-            'welcome': {},
-            'autoroles': {},
-            'autoroles_bot': {},
-            'aliases': {},
-            'gpd_enabled': {}
-        }
-
-        for key, default_value in required_keys.items():
-            if key not in data:
-                data[key] = default_value
-                print(f"🔧 Added missing key: {key}")
-
-        # Force save to ensure all keys are written
-        save_data(data)
-        print("💾 Data validated and saved after loading")
-
-        return data
-
-    except json.JSONDecodeError as e:
-        print(f"❌ Error reading data.json (corrupted): {e}")
-        # Backup corrupted file and create new one
-        try:
-            import shutil
-            shutil.copy('data.json', f'data_backup_corrupted_{int(time.time())}.json')
-            print("📁 Corrupted data.json backed up")
-        except:
-            pass
-
-        default_data = {
-            'no_prefix_users': [957110332495630366],
-            'custom_commands': {},
-            'guild_prefixes': {},
-            'stolen_emojis': {},
-            'stolen_stickers': {}
-        }
-        save_data(default_data)
-        return default_data
+        msgspec.convert(data, schema)
+    except msgspec.ValidationError as e:
+        # Well-formed JSON in an unexpected shape: keep it rather than lose it
+        print(f"⚠️ {label} does not match schema ({e}), loading without validation")
+        return False
+    return True
 
-    except Exception as e:
-        print(f"❌ Error loading data: {e}")
-        default_data = {
-            'no_prefix_users': [957110332495630366],
-            'custom_commands': {},
-            'guild_prefixes': {},
-            'stolen_emojis': {},
-            'stolen_stickers': {}
-        }
-        save_data(default_data)
-        return default_data
+def decode_data(raw, schema=BotData):
+    """Decode a stored document and check its shape"""
+    data = json_loads(raw)
+    if not isinstance(data, dict):
+        raise ValueError(f"expected a JSON object, got {type(data).__name__}")
+    if JSON_CODEC == 'msgspec':
+        check_schema(data, schema)
+    else:
+        # Without msgspec only the top level is checked
+        for key, value in data.items():
+            if key in schema.__annotations__ and not isinstance(value, (dict, list, str, int)):
+                raise ValueError(f"invalid value for {key}: {type(value).__name__}")
+    return data
+
+# Persistent storage - backend selected by STORAGE_BACKEND (json or sqlite)
+_flusher = None
+_state = None
+_database = None
+
+def get_flusher():
+    """Return the write-behind flusher, creating the storage backend on first use"""
+    global _flusher
+    if _flusher is None:
+        from storage import create_backend, WriteBehindFlusher
+        backend = create_backend(os.getenv('STORAGE_BACKEND', 'json'))
+        _flusher = WriteBehindFlusher(backend)
+        register_metrics('storage', _flusher.stats)
+        print(f"🗄️ Using {backend.name} storage backend")
+    return _flusher
+
+def get_storage():
+    """Return the active storage backend"""
+    return get_flusher().backend
+
+def get_state():
+    """Return the in-memory state store that owns bot.data"""
+    global _state
+    if _state is None:
+        from storage import StateStore
+        _state = StateStore(get_flusher())
+        register_metrics('state', _state.stats)
+    return _state
 
-# Global variables for optimized saving
-_last_save_time = 0
-_save_queue = False
+def load_data():
+    """Return the live bot data; only the first call reads from disk"""
+    return get_state().load()
 
 def save_data(data, force_save=False):
-    """Save persistent data to JSON file with rate limiting"""
-    global _last_save_time, _save_queue
-    
-    current_time = time.time()
-    
-    # Rate limit saves to once every 30 seconds unless forced
-    if not force_save and current_time - _last_save_time < 30:
-        _save_queue = True
-        return
-    
-    try:
-        # Create a backup of existing data (only if file exists and is recent)
-        if os.path.exists('data.json'):
-            try:
-                import shutil
-                file_age = current_time - os.path.getmtime('data.json')
-                if file_age > 300:  # Only backup if file is older than 5 minutes
-                    shutil.copy('data.json', 'data_backup.json')
-            except Exception as backup_error:
-                print(f"Warning: Could not create backup: {backup_error}")
-
-        # Write new data with compact formatting for better performance
-        with open('data.json', 'w', encoding='utf-8') as f:
-            json.dump(data, f, separators=(',', ':'), ensure_ascii=False)
-
-        _last_save_time = current_time
-        _save_queue = False
-        print("💾 Data saved successfully")
-
-    except Exception as e:
-        print(f"❌ Error saving data: {e}")
-        # Try to restore backup if save failed
-        if os.path.exists('data_backup.json'):
-            try:
-                import shutil
-                shutil.copy('data_backup.json', 'data.json')
-                print("🔄 Restored data from backup")
-            except Exception as restore_error:
-                print(f"❌ Failed to restore backup: {restore_error}")
-
-def save_data_queued():
-    """Save data if there's a queued save"""
-    global _save_queue
-    if _save_queue:
-        # This will be called by a periodic task
-        pass
+    """Commit all persistent data; force_save writes immediately"""
+    state = get_state()
+    state.data = data
+    state.commit()
+    if force_save:
+        get_flusher().flush_sync()
+
+def save_record(data, section, guild_id=None, key=None):
+    """Commit a single changed record, e.g. one guild's prefix or one custom command"""
+    state = get_state()
+    state.data = data
+    state.commit(section, guild_id, key)
+
+def get_database():
+    """Return the shared SQLite connection for data kept outside bot.data (timers, ...)"""
+    global _database
+    if _database is None:
+        from storage import connect, DB_PATH
+        _database = connect(DB_PATH)
+    return _database
+
+def start_storage():
+    """Start the background flush task (call from the running event loop)"""
+    get_flusher().start()
+
+async def preload_guild(guild_id):
+    """Load a guild's settings off the event loop before they are read (lazy backends only)"""
+    await get_flusher().preload(str(guild_id))
+
+async def close_storage():
+    """Flush pending writes and close the storage backend"""
+    global _database
+    await get_flusher().close()
+    if _database is not None:
+        _database.close()
+        _database = None
 
 # Enhanced emoji fallback system
 def get_emoji(emoji_name):